@@ -0,0 +1,181 @@
+"""
+Batch analysis of many positions at once with NumPy, for building datasets.
+Positions are held as an (N, 8, 8) int8 array indexed like GameState.board: 0 empty, 1..6 white pawn, knight,
+bishop, rook, queen, king and the negatives for black. Attack maps, check status, mobility and material are computed
+for the whole batch with array shifts instead of looping over positions.
+NumPy is only needed for this module. Run the benchmark from the project root with: python -m Chess.BatchAnalysis
+"""
+import time
+
+import numpy as np
+
+from Chess import ChessEngine, MoveOrdering
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
+PIECE_CODES = {'--': 0, 'wp': 1, 'wN': 2, 'wB': 3, 'wR': 4, 'wQ': 5, 'wK': 6,
+               'bp': -1, 'bN': -2, 'bB': -3, 'bR': -4, 'bQ': -5, 'bK': -6}
+CODE_PIECES = [None] * 13 #piece string for code + 6
+for piece, code in PIECE_CODES.items():
+    CODE_PIECES[code + 6] = piece
+# byte value of a packPosition/FEN letter to its code, so packed boards decode with one table lookup
+LETTER_CODES = np.zeros(256, dtype=np.int8)
+for piece, code in PIECE_CODES.items():
+    LETTER_CODES[ord(ChessEngine.PIECE_LETTERS[piece])] = code
+# material of each code + 6, positive for white
+MATERIAL = np.array([0] * 13, dtype=np.int32)
+for piece, code in PIECE_CODES.items():
+    if code != 0:
+        MATERIAL[code + 6] = MoveOrdering.pieceValues[piece[1]] * (1 if code > 0 else -1)
+
+'''
+(N, 8, 8) boards and an (N,) white to move array from a list of GameStates
+'''
+def fromGameStates(states):
+    boards = np.array([[[PIECE_CODES[piece] for piece in row] for row in gs.board] for gs in states], dtype=np.int8)
+    return boards.reshape(len(states), 8, 8), np.array([gs.whiteToMove for gs in states], dtype=bool)
+
+'''
+Boards from GameState.packPosition tuples: the 64 letters of every position are decoded with one table lookup
+'''
+def fromPacked(packed):
+    letters = ''.join(position[0] for position in packed).encode('ascii')
+    boards = LETTER_CODES[np.frombuffer(letters, dtype=np.uint8)].reshape(len(packed), 8, 8)
+    return boards, np.array([position[1] for position in packed], dtype=bool)
+
+'''
+Boards from FEN strings, expanding the digits of each rank into empty squares
+'''
+def fromFens(fens):
+    packed = []
+    for fen in fens:
+        fields = fen.split()
+        letters = ''.join('.' * int(char) if char.isdigit() else char for char in fields[0] if char != '/')
+        if len(letters) != 64:
+            raise ValueError("FEN board does not have 64 squares: " + fen)
+        packed.append((letters, len(fields) < 2 or fields[1] == 'w'))
+    return fromPacked(packed)
+
+'''
+A GameState for one board of the batch; the array is read directly, castling rights and en pessant are cleared
+'''
+def toGameState(board, whiteToMove=True, backend='mailbox'):
+    gs = ChessEngine.newGameState(backend)
+    gs.board = [[CODE_PIECES[code + 6] for code in row] for row in board.tolist()]
+    gs.whiteToMove = bool(whiteToMove)
+    gs.currentCastlingRight = ChessEngine.CastleRights.fromMask(0)
+    gs.enpessantPossible = ()
+    gs.halfmoveClock = 0
+    gs.fullmoveNumber = 1
+    gs.resetDerivedState()
+    return gs
+
+'''
+Move every square of the batch by (dr, dc), filling the squares left behind with zeros
+'''
+def shift(a, dr, dc):
+    out = np.zeros_like(a)
+    out[:, max(dr, 0):8 + min(dr, 0), max(dc, 0):8 + min(dc, 0)] = \
+        a[:, max(-dr, 0):8 + min(-dr, 0), max(-dc, 0):8 + min(-dc, 0)]
+    return out
+
+'''
+Squares attacked by pawns and by the other pieces of one side (sign 1 white, -1 black), as separate count maps
+Each attacker adds 1 to every square it attacks, the same counts as GameState.getAttackMap
+'''
+def sideAttacks(boards, sign):
+    own = boards * np.int8(sign)
+    empty = boards == 0
+    pawns = own == PAWN
+    pawnStep = -1 if sign > 0 else 1 #white pawns attack towards row 0
+    pawnAttacks = shift(pawns, pawnStep, -1).astype(np.int8) + shift(pawns, pawnStep, 1)
+    pieceAttacks = np.zeros(boards.shape, dtype=np.int8)
+    knights = own == KNIGHT
+    for dr, dc in ChessEngine.GameState.knightJumps:
+        pieceAttacks += shift(knights, dr, dc)
+    kings = own == KING
+    queens = own == QUEEN
+    for j, (dr, dc) in enumerate(ChessEngine.GameState.directions):
+        pieceAttacks += shift(kings, dr, dc)
+        ray = queens | (own == (ROOK if j <= 3 else BISHOP)) #orthogonal directions first, then diagonals
+        for distance in range(7):
+            ray = shift(ray, dr, dc)
+            if not ray.any():
+                break
+            pieceAttacks += ray
+            ray &= empty #the first piece on the ray is attacked, everything behind it is not
+    return pawnAttacks, pieceAttacks
+
+'''
+Number of attackers of the given side on every square, (N, 8, 8)
+'''
+def attackMaps(boards, sign):
+    pawnAttacks, pieceAttacks = sideAttacks(boards, sign)
+    return pawnAttacks + pieceAttacks
+
+'''
+Pseudo legal move count of one side: piece moves to squares not holding their own pieces, pawn captures, single
+and double pushes. Pins, checks, castling and en pessant are not considered and a promotion counts once
+'''
+def mobility(boards, sign, pawnAttacks, pieceAttacks):
+    own = boards * np.int8(sign)
+    empty = boards == 0
+    pawns = own == PAWN
+    pushStep = -1 if sign > 0 else 1
+    single = shift(pawns, pushStep, 0) & empty
+    passRow = 5 if sign > 0 else 2 #the row a pawn crosses on its double step
+    rowMask = np.zeros((1, 8, 8), dtype=bool)
+    rowMask[0, passRow] = True
+    double = shift(single & rowMask, pushStep, 0) & empty
+    return ((pieceAttacks * (own <= 0)).sum(axis=(1, 2)) + (pawnAttacks * (own < 0)).sum(axis=(1, 2)) +
+            single.sum(axis=(1, 2)) + double.sum(axis=(1, 2)))
+
+'''
+Analyse a batch: returns a dict of arrays
+whiteAttacks, blackAttacks: (N, 8, 8) attacker counts; inCheck: (N,) side to move in check;
+mobility: (N, 2) pseudo legal move counts for white and black; material: (N,) material balance, white positive
+'''
+def analyze(boards, whiteToMove):
+    whitePawnAttacks, whitePieceAttacks = sideAttacks(boards, 1)
+    blackPawnAttacks, blackPieceAttacks = sideAttacks(boards, -1)
+    whiteAttacks = whitePawnAttacks + whitePieceAttacks
+    blackAttacks = blackPawnAttacks + blackPieceAttacks
+    whiteKingAttacked = (blackAttacks * (boards == KING)).sum(axis=(1, 2)) > 0
+    blackKingAttacked = (whiteAttacks * (boards == -KING)).sum(axis=(1, 2)) > 0
+    return {
+        "whiteAttacks": whiteAttacks,
+        "blackAttacks": blackAttacks,
+        "inCheck": np.where(whiteToMove, whiteKingAttacked, blackKingAttacked),
+        "mobility": np.stack([mobility(boards, 1, whitePawnAttacks, whitePieceAttacks),
+                              mobility(boards, -1, blackPawnAttacks, blackPieceAttacks)], axis=1),
+        "material": MATERIAL[boards.astype(np.int32) + 6].sum(axis=(1, 2)),
+    }
+
+def main():
+    from Chess import Benchmark
+    states = [Benchmark.replay(moveLog) for moveLog in Benchmark.samplePositions()]
+    packed = [gs.packPosition() for gs in states] * 10
+    print("positions:", len(packed))
+
+    start = time.perf_counter()
+    boards, whiteToMove = fromPacked(packed)
+    result = analyze(boards, whiteToMove)
+    batchSeconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for gs in states * 10:
+        gs.getAttackMap('w')
+        gs.getAttackMap('b')
+        gs.inCheck()
+    loopSeconds = time.perf_counter() - start
+
+    for i in range(len(states)):
+        gs = states[i]
+        assert result["whiteAttacks"][i].tolist() == gs.getAttackMap('w')
+        assert result["blackAttacks"][i].tolist() == gs.getAttackMap('b')
+        assert bool(result["inCheck"][i]) == gs.inCheck()
+    print("batch:      %10.0f positions/sec" % (len(packed) / batchSeconds))
+    print("GameState:  %10.0f positions/sec (attack maps and check only)" % (len(packed) / loopSeconds))
+
+
+if __name__ == '__main__':
+    main()
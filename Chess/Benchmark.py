@@ -0,0 +1,121 @@
+"""
+Times move generation so engine changes can be compared before and after.
+Run from the project root with: python -m Chess.Benchmark
+"""
+import random
+import time
+import tracemalloc
+
+from Chess import ChessEngine, Search
+
+SEED = 2024
+GAMES = 20
+PLIES_PER_GAME = 60
+
+'''
+Play seeded random games and keep a copy of every position reached, so each generator is timed on the same positions
+'''
+def samplePositions(games=GAMES, plies=PLIES_PER_GAME, seed=SEED):
+    rng = random.Random(seed)
+    positions = []
+    for game in range(games):
+        gs = ChessEngine.GameState()
+        for ply in range(plies):
+            moves = gs.getValidMoves()
+            if len(moves) == 0:
+                break
+            gs.makeMove(rng.choice(moves))
+            positions.append(list(gs.moveLog))
+    return positions
+
+'''
+Rebuild a position by replaying its moves from the start position
+'''
+def replay(moveLog, backend='mailbox'):
+    gs = ChessEngine.newGameState(backend)
+    for move in moveLog:
+        gs.makeMove(move)
+    return gs
+
+'''
+Count the nodes per second a generator reaches over the sampled positions
+'''
+def timeGenerator(states, generate):
+    start = time.perf_counter()
+    moveCount = 0
+    for gs in states:
+        moveCount += len(generate(gs))
+    elapsed = time.perf_counter() - start
+    return len(states) / elapsed, moveCount
+
+'''
+Count the squareUnderAttack queries per second when every square of every sampled position is tested
+'''
+def timeAttackQueries(states):
+    start = time.perf_counter()
+    queries = 0
+    for gs in states:
+        for r in range(8):
+            for c in range(8):
+                gs.squareUnderAttack(r, c)
+        queries += 64
+    return queries / (time.perf_counter() - start)
+
+'''
+Average bytes allocated per Move when keeping every move generated over the sampled positions
+'''
+def measureMoveMemory(states):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [gs.getValidMoves() for gs in states]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / sum(len(moves) for moves in kept)
+
+'''
+Count the GameStates per second built straight from FEN strings
+'''
+def timeFenLoading(states, repeat=20):
+    fens = [gs.to_fen() for gs in states] * repeat
+    start = time.perf_counter()
+    for fen in fens:
+        ChessEngine.GameState.from_fen(fen)
+    return len(fens) / (time.perf_counter() - start)
+
+'''
+Search every step-th sampled position to a fixed depth with and without killer and history ordering
+Returns (nodes, seconds) for each
+'''
+def compareOrdering(moveLogs, depth=3, step=40):
+    totals = {}
+    for useHeuristics in (False, True):
+        nodes = 0
+        start = time.perf_counter()
+        for moveLog in moveLogs[::step]:
+            searcher = Search.Searcher(1 << 16, useHeuristics)
+            nodes += searcher.search(replay(moveLog), maxDepth=depth).nodes
+        totals[useHeuristics] = (nodes, time.perf_counter() - start)
+    return totals[False], totals[True]
+
+def main():
+    states = [replay(moveLog) for moveLog in samplePositions()]
+    print("positions:", len(states))
+    before, beforeMoves = timeGenerator(states, lambda gs: gs.getValidMovesByMakeUndo())
+    after, afterMoves = timeGenerator(states, lambda gs: gs.getValidMoves())
+    print("make/undo filtering: %10.0f nodes/sec (%d moves)" % (before, beforeMoves))
+    print("pin and check aware: %10.0f nodes/sec (%d moves)" % (after, afterMoves))
+    print("speedup:             %10.1fx" % (after / before))
+    print("squareUnderAttack:   %10.0f queries/sec" % timeAttackQueries(states))
+    print("memory per move:     %10.1f bytes" % measureMoveMemory(states))
+    print("from_fen:            %10.0f positions/sec" % timeFenLoading(states))
+    bitboardStates = [replay(moveLog, 'bitboard') for moveLog in samplePositions()]
+    bitboard, bitboardMoves = timeGenerator(bitboardStates, lambda gs: gs.getValidMoves())
+    print("bitboard backend:    %10.0f nodes/sec (%d moves)" % (bitboard, bitboardMoves))
+    (plainNodes, plainSeconds), (orderedNodes, orderedSeconds) = compareOrdering(samplePositions())
+    print("search, hash/MVV-LVA: %9d nodes in %.2fs" % (plainNodes, plainSeconds))
+    print("search, +killers/history: %5d nodes in %.2fs (%.0f%% of the nodes, %.0f%% of the time)" % (
+        orderedNodes, orderedSeconds, 100 * orderedNodes / plainNodes, 100 * orderedSeconds / plainSeconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,437 @@
+"""
+Bitboard backend for GameState.
+The position is twelve 64 bit piece sets plus occupancy. makeMove and undoMove update them first, then write the 8x8
+board as the view ChessMain and Move read; there are no pieceLocations sets to keep, they are read from the sets.
+Square index is row * 8 + col, so bit 0 is a8 and bit 63 is h1.
+"""
+from Chess import ChessEngine, Evaluation
+
+FULL = (1 << 64) - 1
+
+# (rowStep, colStep, indexStep) in the same order as GameState.directions: orthogonal first, then diagonal
+DIRECTIONS = ((-1, 0, -8), (0, -1, -1), (1, 0, 8), (0, 1, 1), (-1, -1, -9), (-1, 1, -7), (1, -1, 7), (1, 1, 9))
+OPPOSITE = (2, 3, 0, 1, 7, 6, 5, 4)
+KNIGHT_JUMPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+'''
+Precompute the attack and ray tables every generator reads from
+'''
+def buildTables():
+    rays = [[0] * 64 for d in range(8)]
+    knight = [0] * 64
+    king = [0] * 64
+    pawnAttacks = {'w': [0] * 64, 'b': [0] * 64}
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        for d in range(8):
+            dr, dc, step = DIRECTIONS[d]
+            endRow, endCol = r + dr, c + dc
+            if 0 <= endRow <= 7 and 0 <= endCol <= 7:
+                king[sq] |= 1 << (endRow * 8 + endCol)
+            while 0 <= endRow <= 7 and 0 <= endCol <= 7:
+                rays[d][sq] |= 1 << (endRow * 8 + endCol)
+                endRow += dr
+                endCol += dc
+        for dr, dc in KNIGHT_JUMPS:
+            if 0 <= r + dr <= 7 and 0 <= c + dc <= 7:
+                knight[sq] |= 1 << ((r + dr) * 8 + c + dc)
+        for dc in (-1, 1):
+            if 0 <= c + dc <= 7:
+                if r - 1 >= 0:
+                    pawnAttacks['w'][sq] |= 1 << ((r - 1) * 8 + c + dc)
+                if r + 1 <= 7:
+                    pawnAttacks['b'][sq] |= 1 << ((r + 1) * 8 + c + dc)
+    # between[a][b]: squares strictly between two aligned squares; line[a][b]: the whole line through both
+    between = [[0] * 64 for sq in range(64)]
+    line = [[0] * 64 for sq in range(64)]
+    for a in range(64):
+        for d in range(8):
+            ray = rays[d][a]
+            while ray:
+                bit = ray & -ray
+                b = bit.bit_length() - 1
+                between[a][b] = rays[d][a] & ~rays[d][b] & ~bit
+                line[a][b] = rays[d][a] | rays[OPPOSITE[d]][a] | (1 << a)
+                ray ^= bit
+    return rays, knight, king, pawnAttacks, between, line
+
+RAYS, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, BETWEEN, LINE = buildTables()
+ROOK_RAYS = [RAYS[0][sq] | RAYS[1][sq] | RAYS[2][sq] | RAYS[3][sq] for sq in range(64)]
+BISHOP_RAYS = [RAYS[4][sq] | RAYS[5][sq] | RAYS[6][sq] | RAYS[7][sq] for sq in range(64)]
+SQUARE_COORDS = [divmod(sq, 8) for sq in range(64)] #(row, col) of every square index
+# castling rights mask bits that survive a move from or to each square: a king or rook leaving its home square, or a
+# rook captured on it, drops the rights that need it
+CASTLE_KEEP = [15] * 64
+CASTLE_KEEP[60], CASTLE_KEEP[63], CASTLE_KEEP[56] = 15 & ~3, 15 & ~1, 15 & ~2 #e1, h1, a1
+CASTLE_KEEP[4], CASTLE_KEEP[7], CASTLE_KEEP[0] = 15 & ~12, 15 & ~4, 15 & ~8 #e8, h8, a8
+
+'''
+Attacks of a slider on sq along the given directions; the first blocker on each ray is included and the rest cut off
+'''
+def slidingAttacks(sq, occupied, directions):
+    attacks = 0
+    for d in directions:
+        ray = RAYS[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            if DIRECTIONS[d][2] > 0: #towards higher squares the nearest blocker is the lowest bit
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= RAYS[d][first]
+        attacks |= ray
+    return attacks
+
+def rookAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, (0, 1, 2, 3))
+
+def bishopAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, (4, 5, 6, 7))
+
+'''
+Yield the index of every set bit, lowest first
+'''
+def squares(bb):
+    while bb:
+        bit = bb & -bb
+        yield bit.bit_length() - 1
+        bb ^= bit
+
+
+class BitboardGameState(ChessEngine.GameState):
+    def resetDerivedState(self):
+        super().resetDerivedState()
+        self.castleMask = self.currentCastlingRight.mask()
+
+    '''
+    Build every piece set and occupancy from the 8x8 board
+    '''
+    def locatePieces(self):
+        self.pieceBB = {piece: 0 for piece in ('wp', 'wR', 'wN', 'wB', 'wQ', 'wK',
+                                               'bp', 'bR', 'bN', 'bB', 'bQ', 'bK')}
+        self.colorBB = {'w': 0, 'b': 0}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != '--':
+                    self.pieceBB[piece] |= 1 << (r * 8 + c)
+                    self.colorBB[piece[0]] |= 1 << (r * 8 + c)
+        self.occupied = self.colorBB['w'] | self.colorBB['b']
+        self.wKingLoc = SQUARE_COORDS[self.pieceBB['wK'].bit_length() - 1]
+        self.bKingLoc = SQUARE_COORDS[self.pieceBB['bK'].bit_length() - 1]
+
+    '''
+    (row, col) of every piece of each side, read from the color sets; a fresh copy on every access
+    '''
+    @property
+    def pieceLocations(self):
+        return {color: {SQUARE_COORDS[sq] for sq in squares(self.colorBB[color])} for color in ('w', 'b')}
+
+    '''
+    Make a move on the piece sets, then mirror it on the board view and update the evaluation totals and the position
+    key with only what the move changed. The undo record also keeps the evaluation totals, so undoMove restores them
+    instead of working them out again
+    '''
+    def makeMove(self, move):
+        midgame = Evaluation.MIDGAME
+        endgame = Evaluation.ENDGAME
+        phases = Evaluation.PHASE
+        zobrist = ChessEngine.ZOBRIST_PIECES
+        board = self.board
+        pieceBB = self.pieceBB
+        colorBB = self.colorBB
+        moved = move.pieceMoved
+        color = moved[0]
+        startRow, startCol, endRow, endCol = move.startRow, move.startCol, move.endRow, move.endCol
+        startSq = startRow * 8 + startCol
+        endSq = endRow * 8 + endCol
+        oldMask = self.castleMask
+        oldEnpessant = self.enpessantPossible
+        key = self.zobristKey
+        self.undoStack.append((oldMask, oldEnpessant, self.halfmoveClock, key, self.mgScore, self.egScore, self.phase))
+        self.moveLog.append(move)
+        self.whiteToMove = not self.whiteToMove
+
+        placed = color + move.promotionChoice if move.isPawnPromotion else moved
+        fromBit = 1 << startSq
+        toBit = 1 << endSq
+        pieceBB[moved] ^= fromBit
+        pieceBB[placed] ^= toBit
+        colorBB[color] ^= fromBit | toBit
+        board[startRow][startCol] = '--'
+        board[endRow][endCol] = placed
+        mg = midgame[placed][endSq] - midgame[moved][startSq]
+        eg = endgame[placed][endSq] - endgame[moved][startSq]
+        phase = phases[placed] - phases[moved]
+        key ^= ChessEngine.ZOBRIST_BLACK_TO_MOVE ^ zobrist[moved][startSq] ^ zobrist[placed][endSq]
+
+        captured = move.pieceCaptured
+        if captured != '--':
+            if move.isEnpessantMove:
+                capturedSq = startRow * 8 + endCol
+                board[startRow][endCol] = '--'
+            else:
+                capturedSq = endSq
+            capturedBit = 1 << capturedSq
+            pieceBB[captured] ^= capturedBit
+            colorBB[captured[0]] ^= capturedBit
+            mg -= midgame[captured][capturedSq]
+            eg -= endgame[captured][capturedSq]
+            phase -= phases[captured]
+            key ^= zobrist[captured][capturedSq]
+            self.halfmoveClock = 0
+        elif moved[1] == 'p':
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+            if move.isCastleMove:
+                rook = color + 'R'
+                if endCol - startCol == 2: #kingside: rook from endCol+1 to endCol-1
+                    rookFrom, rookTo = endSq + 1, endSq - 1
+                else: #queenside: rook from endCol-2 to endCol+1
+                    rookFrom, rookTo = endSq - 2, endSq + 1
+                rookBits = (1 << rookFrom) | (1 << rookTo)
+                pieceBB[rook] ^= rookBits
+                colorBB[color] ^= rookBits
+                board[endRow][rookFrom - endRow * 8] = '--'
+                board[endRow][rookTo - endRow * 8] = rook
+                mg += midgame[rook][rookTo] - midgame[rook][rookFrom]
+                eg += endgame[rook][rookTo] - endgame[rook][rookFrom]
+                key ^= zobrist[rook][rookFrom] ^ zobrist[rook][rookTo]
+        self.occupied = colorBB['w'] | colorBB['b']
+        self.mgScore += mg
+        self.egScore += eg
+        self.phase += phase
+
+        if moved == 'wK':
+            self.wKingLoc = (endRow, endCol)
+        elif moved == 'bK':
+            self.bKingLoc = (endRow, endCol)
+        if moved[1] == 'p' and (startRow - endRow == 2 or endRow - startRow == 2): #only on 2 square pawn advance
+            self.enpessantPossible = ((startRow + endRow) // 2, startCol)
+            key ^= ChessEngine.ZOBRIST_ENPESSANT[startCol]
+        else:
+            self.enpessantPossible = ()
+        if oldEnpessant != ():
+            key ^= ChessEngine.ZOBRIST_ENPESSANT[oldEnpessant[1]]
+        mask = oldMask & CASTLE_KEEP[startSq] & CASTLE_KEEP[endSq]
+        if mask != oldMask:
+            self.castleMask = mask
+            self.currentCastlingRight.setMask(mask)
+            key ^= ChessEngine.ZOBRIST_CASTLING[oldMask] ^ ChessEngine.ZOBRIST_CASTLING[mask]
+        if color == 'b':
+            self.fullmoveNumber += 1
+        self.zobristKey = key
+
+    def undoMove(self):
+        if len(self.moveLog) == 0:
+            return
+        move = self.moveLog.pop()
+        mask, self.enpessantPossible, self.halfmoveClock, self.zobristKey, self.mgScore, self.egScore, self.phase = \
+            self.undoStack.pop()
+        if mask != self.castleMask:
+            self.castleMask = mask
+            self.currentCastlingRight.setMask(mask)
+        self.whiteToMove = not self.whiteToMove
+        board = self.board
+        pieceBB = self.pieceBB
+        colorBB = self.colorBB
+        moved = move.pieceMoved
+        color = moved[0]
+        startRow, startCol, endRow, endCol = move.startRow, move.startCol, move.endRow, move.endCol
+        startSq = startRow * 8 + startCol
+        endSq = endRow * 8 + endCol
+
+        placed = color + move.promotionChoice if move.isPawnPromotion else moved
+        fromBit = 1 << startSq
+        toBit = 1 << endSq
+        pieceBB[moved] ^= fromBit
+        pieceBB[placed] ^= toBit
+        colorBB[color] ^= fromBit | toBit
+        board[startRow][startCol] = moved
+        captured = move.pieceCaptured
+        if captured != '--':
+            if move.isEnpessantMove:
+                capturedSq = startRow * 8 + endCol
+                board[startRow][endCol] = captured
+                board[endRow][endCol] = '--'
+            else:
+                capturedSq = endSq
+                board[endRow][endCol] = captured
+            capturedBit = 1 << capturedSq
+            pieceBB[captured] ^= capturedBit
+            colorBB[captured[0]] ^= capturedBit
+        else:
+            board[endRow][endCol] = '--'
+            if move.isCastleMove:
+                rook = color + 'R'
+                if endCol - startCol == 2:
+                    rookFrom, rookTo = endSq + 1, endSq - 1
+                else:
+                    rookFrom, rookTo = endSq - 2, endSq + 1
+                rookBits = (1 << rookFrom) | (1 << rookTo)
+                pieceBB[rook] ^= rookBits
+                colorBB[color] ^= rookBits
+                board[endRow][rookTo - endRow * 8] = '--'
+                board[endRow][rookFrom - endRow * 8] = rook
+        self.occupied = colorBB['w'] | colorBB['b']
+        if moved == 'wK':
+            self.wKingLoc = (startRow, startCol)
+        elif moved == 'bK':
+            self.bKingLoc = (startRow, startCol)
+        if color == 'b':
+            self.fullmoveNumber -= 1
+
+    '''
+    Bitboard of the pieces of the given color attacking sq with the given occupancy
+    '''
+    def attackersTo(self, sq, color, occupied):
+        bb = self.pieceBB
+        queens = bb[color + 'Q']
+        return (KNIGHT_ATTACKS[sq] & bb[color + 'N']) | (KING_ATTACKS[sq] & bb[color + 'K']) | \
+               (PAWN_ATTACKS['b' if color == 'w' else 'w'][sq] & bb[color + 'p']) | \
+               (rookAttacks(sq, occupied) & (bb[color + 'R'] | queens)) | \
+               (bishopAttacks(sq, occupied) & (bb[color + 'B'] | queens))
+
+    def isAttackedBy(self, r, c, color):
+        return self.attackersTo(r * 8 + c, color, self.occupied) != 0
+
+    '''
+    Legal moves of one stage, 'all', 'tactical' or 'quiet', generated from the piece sets
+    '''
+    def generateLegalMoves(self, stage):
+        moves = []
+        board = self.board
+        ally, enemy = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        bb = self.pieceBB
+        own = self.colorBB[ally]
+        them = self.colorBB[enemy]
+        occupied = self.occupied
+        kingSq = (bb[ally + 'K'] & -bb[ally + 'K']).bit_length() - 1
+        kingRow, kingCol = divmod(kingSq, 8)
+
+        checkers = self.attackersTo(kingSq, enemy, occupied)
+        if checkers == 0:
+            checkMask = FULL
+        elif checkers & (checkers - 1) == 0: #single check: capture the checker or block the ray
+            checkMask = checkers | BETWEEN[kingSq][checkers.bit_length() - 1]
+        else: #double check: only the king can move
+            checkMask = 0
+
+        # pinned pieces may only move along the line through their king and the pinning slider
+        pinLines = {}
+        snipers = (ROOK_RAYS[kingSq] & (bb[enemy + 'R'] | bb[enemy + 'Q'])) | \
+                  (BISHOP_RAYS[kingSq] & (bb[enemy + 'B'] | bb[enemy + 'Q']))
+        while snipers:
+            bit = snipers & -snipers
+            snipers ^= bit
+            sniper = bit.bit_length() - 1
+            blockers = BETWEEN[kingSq][sniper] & occupied
+            if blockers and blockers & (blockers - 1) == 0 and blockers & own:
+                pinLines[blockers.bit_length() - 1] = LINE[kingSq][sniper]
+
+        Move = ChessEngine.Move
+        coords = SQUARE_COORDS
+        # squares the pieces may move to in this stage; pawns also take promotions as tactical and en pessant
+        if stage == 'all':
+            stageMask = ~own & FULL
+        elif stage == 'tactical':
+            stageMask = them
+        else:
+            stageMask = ~occupied & FULL
+        # the bit loops below are written out instead of using squares(), generator calls per bit cost too much here
+        if checkMask:
+            forward, startRow, promotionRow = (-8, 6, 0) if ally == 'w' else (8, 1, 7)
+            empty = ~occupied & FULL
+            pawnAttacks = PAWN_ATTACKS[ally]
+            promotionRank = 0xFF << (promotionRow * 8)
+            if stage == 'all':
+                pawnMask = FULL
+            elif stage == 'tactical':
+                pawnMask = them | promotionRank
+            else:
+                pawnMask = empty & ~promotionRank
+            epBit = 0
+            if self.enpessantPossible != () and stage != 'quiet':
+                epRow, epCol = self.enpessantPossible
+                epBit = 1 << (epRow * 8 + epCol)
+            pawns = bb[ally + 'p']
+            while pawns:
+                bit = pawns & -pawns
+                pawns ^= bit
+                sq = bit.bit_length() - 1
+                start = coords[sq]
+                targets = pawnAttacks[sq] & them
+                oneStep = sq + forward
+                if (1 << oneStep) & empty:
+                    targets |= 1 << oneStep
+                    if start[0] == startRow and (1 << (oneStep + forward)) & empty:
+                        targets |= 1 << (oneStep + forward)
+                targets &= pawnMask & checkMask & pinLines.get(sq, FULL)
+                while targets:
+                    bit = targets & -targets
+                    targets ^= bit
+                    end = coords[bit.bit_length() - 1]
+                    if end[0] == promotionRow:
+                        for promotion in Move.promotionPieces:
+                            moves.append(Move(start, end, board, promotionChoice=promotion))
+                    else:
+                        moves.append(Move(start, end, board))
+                if pawnAttacks[sq] & epBit:
+                    epSq = epBit.bit_length() - 1
+                    if self.isEnpessantSafe(sq, epSq, start[0] * 8 + epSq % 8, kingSq, enemy):
+                        moves.append(Move(start, coords[epSq], board, isEnpessantMove=True))
+            targetMask = stageMask & checkMask
+            for piece in ('N', 'B', 'R', 'Q'):
+                pieces = bb[ally + piece]
+                while pieces:
+                    bit = pieces & -pieces
+                    pieces ^= bit
+                    sq = bit.bit_length() - 1
+                    if piece == 'N':
+                        if sq in pinLines: #a pinned knight can never stay on the pin line
+                            continue
+                        targets = KNIGHT_ATTACKS[sq] & targetMask
+                    else:
+                        if piece == 'B':
+                            attacks = bishopAttacks(sq, occupied)
+                        elif piece == 'R':
+                            attacks = rookAttacks(sq, occupied)
+                        else:
+                            attacks = rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+                        targets = attacks & targetMask & pinLines.get(sq, FULL)
+                    start = coords[sq]
+                    while targets:
+                        bit = targets & -targets
+                        targets ^= bit
+                        moves.append(Move(start, coords[bit.bit_length() - 1], board))
+
+        # the king must not step onto an attacked square; it is taken out of the occupancy so it cannot hide behind itself
+        occupiedWithoutKing = occupied ^ (1 << kingSq)
+        targets = KING_ATTACKS[kingSq] & stageMask
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            to = bit.bit_length() - 1
+            if self.attackersTo(to, enemy, occupiedWithoutKing) == 0:
+                moves.append(Move((kingRow, kingCol), coords[to], board))
+
+        if checkers == 0 and stage != 'tactical':
+            self.getCastleMoves(kingRow, kingCol, moves)
+        return moves
+
+    '''
+    En pessant clears two pawns off one rank, so the king is tested against the occupancy after the capture
+    '''
+    def isEnpessantSafe(self, fromSq, toSq, capturedSq, kingSq, enemy):
+        occupied = self.occupied ^ (1 << fromSq) ^ (1 << toSq) ^ (1 << capturedSq)
+        bb = self.pieceBB
+        queens = bb[enemy + 'Q']
+        if rookAttacks(kingSq, occupied) & (bb[enemy + 'R'] | queens):
+            return False
+        if bishopAttacks(kingSq, occupied) & (bb[enemy + 'B'] | queens):
+            return False
+        if KNIGHT_ATTACKS[kingSq] & bb[enemy + 'N']:
+            return False
+        pawns = bb[enemy + 'p'] & ~(1 << capturedSq)
+        return PAWN_ATTACKS['b' if enemy == 'w' else 'w'][kingSq] & pawns == 0
@@ -3,10 +3,49 @@ Stores all info about current state of chess game and determining the valid move
 at current state.
 Also keeps move log
 """
+import collections
+import random
+from array import array
+
+from Chess import Evaluation
+
+# Zobrist keys: one random 64 bit number per (piece, square), castling rights mask, en pessant file and side to move
+# the position key is the xor of the keys of everything in the position, so a move only xors in what it changes
+zobristRandom = random.Random(20240229)
+ZOBRIST_PIECES = {piece: [zobristRandom.getrandbits(64) for sq in range(64)]
+                  for piece in ('wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK')}
+ZOBRIST_CASTLING = [zobristRandom.getrandbits(64) for mask in range(16)]
+ZOBRIST_ENPESSANT = [zobristRandom.getrandbits(64) for col in range(8)]
+ZOBRIST_BLACK_TO_MOVE = zobristRandom.getrandbits(64)
+
+# one character per piece for packed positions, FEN letters with '.' for an empty square
+PIECE_LETTERS = {'wp': 'P', 'wR': 'R', 'wN': 'N', 'wB': 'B', 'wQ': 'Q', 'wK': 'K',
+                 'bp': 'p', 'bR': 'r', 'bN': 'n', 'bB': 'b', 'bQ': 'q', 'bK': 'k', '--': '.'}
+LETTER_PIECES = {v: k for k, v in PIECE_LETTERS.items()}
+FEN_PIECE_LETTERS = 'PRNBQKprnbqk'
+
+# the same few rank strings ('8', 'pppppppp', ...) make up most FENs, so each one is parsed once
+FEN_RANK_CACHE_SIZE = 1 << 16
+fenRankCache = {}
 
 
 class GameState():
-    def __init__(self):
+    enemyPiece = {True: 'b', False: 'w'}
+    # orthogonal directions first, then diagonals
+    directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+    knightJumps = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+    moveCache = None #LegalMoveCache consulted by getValidMoves, set on the class or one GameState to turn it on
+
+    '''
+    Starts from the initial position, or from the position in fen if one is given
+    '''
+    def __init__(self, fen=None):
+        self.pins = {} #allied pieces pinned to the king mapped to the pin direction
+        self.checks = [] #enemy pieces checking the king
+        if fen is not None:
+            self.setFen(fen)
+            return
+
         # board is 8x8 2d list each element of the list has 2 characters
         # first character represents color (b or w)
         # second character represents the type of piece K Q R B N p
@@ -21,30 +60,212 @@ class GameState():
             ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
             ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"], ]
 
-        self.moveFunctions = {'p': self.getPawnMoves, 'R': self.getRookMoves, 'N': self.getKnightMoves,
-                              'B': self.getBishopMoves,
-                              'Q': self.getQueenMoves, 'K': self.getKingMoves}
-        self.enemyPiece = {True: 'b', False: 'w'}
-
         self.whiteToMove = True
-        self.moveLog = []
+        self.enpessantPossible = () #coordinates for the square where en pessant capture is possible
+        self.currentCastlingRight = CastleRights(True, True, True, True)
+        self.halfmoveClock = 0 #plies since the last capture or pawn move, for the fifty move rule
+        self.fullmoveNumber = 1
+        self.resetDerivedState()
+
+    '''
+    Build a GameState directly from a FEN string, without replaying moves from the start position
+    '''
+    @classmethod
+    def from_fen(cls, fen):
+        return cls(fen)
+
+    '''
+    Set the position from a FEN string: board, side to move, castling rights, en pessant square and move counters
+    Raises ValueError for a malformed FEN; castling rights without their king and rook at home and an en pessant
+    square no pawn can be taken on are dropped
+    '''
+    def setFen(self, fen):
+        if not isinstance(fen, str):
+            raise ValueError("FEN must be a string: %r" % (fen,))
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        board = []
+        for rank in fields[0].split('/'):
+            pieces = fenRankCache.get(rank)
+            if pieces is None:
+                pieces = []
+                for char in rank:
+                    if char in '12345678':
+                        pieces.extend(['--'] * int(char))
+                    elif char in FEN_PIECE_LETTERS:
+                        pieces.append(LETTER_PIECES[char])
+                    else:
+                        raise ValueError("FEN rank has an unknown piece letter: " + rank)
+                if len(pieces) != 8:
+                    raise ValueError("FEN rank does not have 8 squares: " + rank)
+                pieces = tuple(pieces)
+                if len(fenRankCache) >= FEN_RANK_CACHE_SIZE:
+                    fenRankCache.clear()
+                fenRankCache[rank] = pieces
+            board.append(list(pieces))
+        if len(board) != 8:
+            raise ValueError("FEN board does not have 8 ranks: " + fields[0])
+        for king in ('wK', 'bK'):
+            if sum(row.count(king) for row in board) != 1:
+                raise ValueError("FEN board needs exactly one king per side: " + fields[0])
+        if 'wp' in board[0] or 'bp' in board[0] or 'wp' in board[7] or 'bp' in board[7]:
+            raise ValueError("FEN board has a pawn on rank 1 or 8: " + fields[0])
+        if fields[1] not in ('w', 'b'):
+            raise ValueError("FEN side to move must be w or b: " + fields[1])
+        whiteToMove = fields[1] == 'w'
+        castling = fields[2]
+        if castling != '-' and (not castling or any(char not in 'KQkq' for char in castling)):
+            raise ValueError("FEN castling rights must be - or letters from KQkq: " + castling)
+        #a right is only kept while its king and rook are still on their home squares
+        castleRights = []
+        for letter, row, rookCol in (('K', 7, 7), ('k', 0, 7), ('Q', 7, 0), ('q', 0, 0)):
+            color = 'w' if letter.isupper() else 'b'
+            castleRights.append(letter in castling and board[row][4] == color + 'K' and
+                                board[row][rookCol] == color + 'R')
+        enpessant = fields[3]
+        if enpessant != '-' and (len(enpessant) != 2 or enpessant[0] not in Move.filesToCols or
+                                 enpessant[1] not in ('3', '6')):
+            raise ValueError("FEN en pessant square must be - or a square on rank 3 or 6: " + enpessant)
+        enpessantPossible = ()
+        if enpessant != '-':
+            row, col = Move.ranksToRows[enpessant[1]], Move.filesToCols[enpessant[0]]
+            #kept only on the side to move's capture rank, empty, with the double pushed pawn right behind it
+            pushed, pawnRow, fromRow = ('bp', 3, 1) if whiteToMove else ('wp', 4, 6)
+            if row == (2 if whiteToMove else 5) and board[row][col] == '--' and board[fromRow][col] == '--' and \
+                    board[pawnRow][col] == pushed:
+                enpessantPossible = (row, col)
+        halfmoveClock = int(fields[4]) if len(fields) > 4 else 0 #int raises ValueError for a bad counter
+        fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        self.board = board
+        self.whiteToMove = whiteToMove
+        self.currentCastlingRight = CastleRights(*castleRights)
+        self.enpessantPossible = enpessantPossible
+        self.halfmoveClock = halfmoveClock
+        self.fullmoveNumber = fullmoveNumber
+        self.resetDerivedState()
+
+    '''
+    The current position as a FEN string
+    '''
+    def to_fen(self):
+        ranks = []
+        for row in self.board:
+            rank = ''
+            empty = 0
+            for piece in row:
+                if piece == '--':
+                    empty += 1
+                else:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += PIECE_LETTERS[piece]
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        rights = self.currentCastlingRight
+        castling = ('K' if rights.wks else '') + ('Q' if rights.wqs else '') + \
+                   ('k' if rights.bks else '') + ('q' if rights.bqs else '')
+        if self.enpessantPossible != ():
+            enpessant = Move.colsToFiles[self.enpessantPossible[1]] + Move.rowsToRanks[self.enpessantPossible[0]]
+        else:
+            enpessant = '-'
+        return "%s %s %s %s %d %d" % ('/'.join(ranks), 'w' if self.whiteToMove else 'b', castling or '-',
+                                      enpessant, self.halfmoveClock, self.fullmoveNumber)
 
-        self.wKingLoc = (7, 4)
-        self.bKingLoc = (0, 4)
+    '''
+    Rebuild the class wide table of piece move generators from the class attributes, after they were wrapped or
+    restored (see Profiler). The table holds plain functions, called with the GameState as the first argument,
+    so no GameState keeps a generator of its own
+    '''
+    @classmethod
+    def bindMoveFunctions(cls):
+        cls.moveFunctions = {'p': cls.getPawnMoves, 'R': cls.getRookMoves, 'N': cls.getKnightMoves,
+                             'B': cls.getBishopMoves,
+                             'Q': cls.getQueenMoves, 'K': cls.getKingMoves}
 
+    '''
+    Recompute everything derived from the board, side to move, castling rights and en pessant square
+    after they were set directly, and start a fresh move log from this position
+    '''
+    def resetDerivedState(self):
+        self.locatePieces()
+        self.mgScore, self.egScore, self.phase = Evaluation.evaluateBoard(self.board)
+        self.moveLog = []
         self.checkmate = False
         self.stalemate = False
+        # one record per move in moveLog with what the move destroys and undoMove cannot work out from the move:
+        # (castling rights mask, en pessant square, halfmove clock, position key), all from before the move
+        # the keys double as the position history for repetition detection
+        self.undoStack = []
+        self.zobristKey = self.computeZobristKey()
 
-        self.enpessantPossible = () #coordinates for the square where en pessant capture is possible
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                             self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+    '''
+    Find every piece and both kings on the board; makeMove and undoMove keep them up to date after this
+    '''
+    def locatePieces(self):
+        self.pieceLocations = {'w': set(), 'b': set()} #(row, col) of every piece of each side
+        for r in range(8):
+            row = self.board[r]
+            for c in range(8):
+                piece = row[c]
+                if piece != '--':
+                    self.pieceLocations[piece[0]].add((r, c))
+                    if piece == 'wK':
+                        self.wKingLoc = (r, c)
+                    elif piece == 'bK':
+                        self.bKingLoc = (r, c)
+
+    '''
+    The position as a small tuple that is cheap to pickle and send to another process:
+    (64 piece letters, white to move, castling rights mask, en pessant square index or -1)
+    The move log is not included
+    '''
+    def packPosition(self):
+        enpessant = self.enpessantPossible[0] * 8 + self.enpessantPossible[1] if self.enpessantPossible != () else -1
+        return (''.join([PIECE_LETTERS[piece] for row in self.board for piece in row]), self.whiteToMove,
+                self.currentCastlingRight.mask(), enpessant)
+
+    '''
+    Set this GameState to a position made by packPosition
+    '''
+    def loadPackedPosition(self, packed):
+        letters, whiteToMove, castleMask, enpessant = packed
+        self.board = [[LETTER_PIECES[letter] for letter in letters[r * 8:r * 8 + 8]] for r in range(8)]
+        self.whiteToMove = whiteToMove
+        self.currentCastlingRight = CastleRights.fromMask(castleMask)
+        self.enpessantPossible = divmod(enpessant, 8) if enpessant >= 0 else ()
+        self.halfmoveClock = 0
+        self.fullmoveNumber = 1
+        self.resetDerivedState()
+
+    '''
+    Hash the whole position from scratch, makeMove and undoMove keep it up to date incrementally after this
+    '''
+    def computeZobristKey(self):
+        key = 0
+        sq = 0
+        for row in self.board:
+            for piece in row:
+                if piece != '--':
+                    key ^= ZOBRIST_PIECES[piece][sq]
+                sq += 1
+        key ^= ZOBRIST_CASTLING[self.currentCastlingRight.mask()]
+        if self.enpessantPossible != ():
+            key ^= ZOBRIST_ENPESSANT[self.enpessantPossible[1]]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key
 
     '''
     Takes move as a parameter and executes it (does not work for castling, en pessant, pawn promotion)
     '''
 
     def makeMove(self, move):
+        oldCastleMask = self.currentCastlingRight.mask()
+        oldEnpessant = self.enpessantPossible
+        self.undoStack.append((oldCastleMask, oldEnpessant, self.halfmoveClock, self.zobristKey))
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move)
@@ -52,13 +273,13 @@ class GameState():
 
         # update kings location if moved
         if move.pieceMoved == 'wK':
-            self.wKingLoc == (move.endRow, move.endCol)
+            self.wKingLoc = (move.endRow, move.endCol)
         elif move.pieceMoved == 'bK':
-            self.bKingLoc == (move.endRow, move.endCol)
+            self.bKingLoc = (move.endRow, move.endCol)
 
         #pawn promotion
         if move.isPawnPromotion:
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + 'Q' #takes color of promoted pawn and makes it a queen
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionChoice #takes color of promoted pawn and makes it the chosen piece
 
         #enpessant move
         if move.isEnpessantMove:
@@ -80,39 +301,66 @@ class GameState():
                 self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-2] #moves the rook
                 self.board[move.endRow][move.endCol-2] = '--' #moves the rook
 
+        self.updatePieceTracking(move, 1)
+
         #update castling rights - whenever it is a rook or a king move
         self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                             self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+
+        #move counters
+        if move.pieceMoved[1] == 'p' or move.pieceCaptured != '--':
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if move.pieceMoved[0] == 'b':
+            self.fullmoveNumber += 1
+
+        #update the position key with only what the move changed
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_PIECES[move.pieceMoved][move.startRow * 8 + move.startCol]
+        key ^= ZOBRIST_PIECES[self.board[move.endRow][move.endCol]][move.endRow * 8 + move.endCol]
+        if move.isEnpessantMove:
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.startRow * 8 + move.endCol]
+        elif move.pieceCaptured != '--':
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.endRow * 8 + move.endCol]
+        if move.isCastleMove:
+            rook = move.pieceMoved[0] + 'R'
+            if move.endCol - move.startCol == 2: #kingside rook jumps from the corner to the other side of the king
+                key ^= ZOBRIST_PIECES[rook][move.endRow * 8 + move.endCol + 1] ^ ZOBRIST_PIECES[rook][move.endRow * 8 + move.endCol - 1]
+            else:
+                key ^= ZOBRIST_PIECES[rook][move.endRow * 8 + move.endCol - 2] ^ ZOBRIST_PIECES[rook][move.endRow * 8 + move.endCol + 1]
+        key ^= ZOBRIST_CASTLING[oldCastleMask] ^ ZOBRIST_CASTLING[self.currentCastlingRight.mask()]
+        if oldEnpessant != ():
+            key ^= ZOBRIST_ENPESSANT[oldEnpessant[1]]
+        if self.enpessantPossible != ():
+            key ^= ZOBRIST_ENPESSANT[self.enpessantPossible[1]]
+        self.zobristKey = key
 
     '''
     Undo the last move made
     '''
     def undoMove(self):
-        if len(self.moveLog) != 0:  # make sure that there is a move to undo
-            move = self.moveLog.pop()
-            self.board[move.startRow][move.startCol] = move.pieceMoved  # moves piece back
-            self.board[move.endRow][move.endCol] = move.pieceCaptured  # moves captured piece back
-            self.whiteToMove = not self.whiteToMove  # swaps turn back
+        if len(self.moveLog) == 0:  # make sure that there is a move to undo
+            return
+        move = self.moveLog.pop()
+        castleMask, self.enpessantPossible, self.halfmoveClock, self.zobristKey = self.undoStack.pop()
+        self.board[move.startRow][move.startCol] = move.pieceMoved  # moves piece back
+        self.board[move.endRow][move.endCol] = move.pieceCaptured  # moves captured piece back
+        self.whiteToMove = not self.whiteToMove  # swaps turn back
 
         # update kings location if moved
         if move.pieceMoved == 'wK':
-            self.wKingLoc == (move.startRow, move.startCol)
+            self.wKingLoc = (move.startRow, move.startCol)
         elif move.pieceMoved == 'bK':
-            self.bKingLoc == (move.startRow, move.startCol)
+            self.bKingLoc = (move.startRow, move.startCol)
 
         #undo enpessant move
         if move.isEnpessantMove:
             self.board[move.endRow][move.endCol] = '--' #leave landing square blank
             self.board[move.startRow][move.endCol] = move.pieceCaptured
-            self.enpessantPossible = (move.endRow, move.endCol)
-        #undo 2 square pawn advance
-        if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:
-            self.enpessantPossible = ()
-        #undeo castling rights
-        self.castleRightsLog.pop() #get rid of the new castle rights from the move we are undoing
-        newRights = self.castleRightsLog[-1]
-        self.currentCastlingRight = CastleRights(newRights.wks, newRights.bks, newRights.wqs, newRights.bqs) #set the current castling rights to the last one in the list
+        if move.pieceMoved[0] == 'b':
+            self.fullmoveNumber -= 1
+        #undo castling rights in place from the saved mask
+        self.currentCastlingRight.setMask(castleMask)
         #undo castle move
         if move.isCastleMove:
             if move.endCol - move.startCol == 2: #kingside
@@ -121,6 +369,90 @@ class GameState():
             else: #queenside
                 self.board[move.endRow][move.endCol-2] = self.board[move.endRow][move.endCol+1]
                 self.board[move.endRow][move.endCol+1] = '--'
+        self.updatePieceTracking(move, -1)
+
+    '''
+    Keep the piece location sets and the evaluation totals in step with the board
+    sign is 1 when the move is made and -1 when it is undone
+    '''
+    def updatePieceTracking(self, move, sign):
+        midgame = Evaluation.MIDGAME
+        endgame = Evaluation.ENDGAME
+        start = (move.startRow, move.startCol)
+        end = (move.endRow, move.endCol)
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+        moved = move.pieceMoved
+        allies = self.pieceLocations[moved[0]]
+        if sign > 0:
+            allies.remove(start)
+            allies.add(end)
+        else:
+            allies.remove(end)
+            allies.add(start)
+        if move.isPawnPromotion:
+            placed = moved[0] + move.promotionChoice
+            phase = Evaluation.PHASE[placed]
+        else:
+            placed = moved
+            phase = 0
+        mg = midgame[placed][endSq] - midgame[moved][startSq]
+        eg = endgame[placed][endSq] - endgame[moved][startSq]
+
+        captured = move.pieceCaptured
+        if captured != '--':
+            victim = (move.startRow, move.endCol) if move.isEnpessantMove else end
+            victimSq = victim[0] * 8 + victim[1]
+            mg -= midgame[captured][victimSq]
+            eg -= endgame[captured][victimSq]
+            phase -= Evaluation.PHASE[captured]
+            if sign > 0:
+                self.pieceLocations[captured[0]].remove(victim)
+            else:
+                self.pieceLocations[captured[0]].add(victim)
+
+        if move.isCastleMove:
+            rook = moved[0] + 'R'
+            if move.endCol - move.startCol == 2: #kingside
+                rookFrom, rookTo = (move.endRow, move.endCol + 1), (move.endRow, move.endCol - 1)
+            else:
+                rookFrom, rookTo = (move.endRow, move.endCol - 2), (move.endRow, move.endCol + 1)
+            fromSq = rookFrom[0] * 8 + rookFrom[1]
+            toSq = rookTo[0] * 8 + rookTo[1]
+            mg += midgame[rook][toSq] - midgame[rook][fromSq]
+            eg += endgame[rook][toSq] - endgame[rook][fromSq]
+            if sign > 0:
+                allies.remove(rookFrom)
+                allies.add(rookTo)
+            else:
+                allies.remove(rookTo)
+                allies.add(rookFrom)
+
+        if sign > 0:
+            self.mgScore += mg
+            self.egScore += eg
+            self.phase += phase
+        else:
+            self.mgScore -= mg
+            self.egScore -= eg
+            self.phase -= phase
+
+    '''
+    Threefold repetition: the current position has occurred at least twice before with the same side to move
+    Only positions since the last capture or pawn move can repeat, so the scan stops there
+    '''
+    def isThreefoldRepetition(self):
+        count = 1
+        plies = len(self.moveLog)
+        for ply in range(plies - 1, -1, -1):
+            move = self.moveLog[ply]
+            if move.pieceMoved[1] == 'p' or move.pieceCaptured != '--':
+                break
+            if (plies - ply) % 2 == 0 and self.undoStack[ply][3] == self.zobristKey: #same side to move
+                count += 1
+                if count >= 3:
+                    return True
+        return False
 
     '''
     Update the castle rights given the move
@@ -144,14 +476,174 @@ class GameState():
                     self.currentCastlingRight.bqs = False
                 elif move.startCol == 7: #right rook
                     self.currentCastlingRight.bks = False
+        #a rook captured on its starting corner can no longer castle
+        if move.pieceCaptured == 'wR' and move.endRow == 7:
+            if move.endCol == 0:
+                self.currentCastlingRight.wqs = False
+            elif move.endCol == 7:
+                self.currentCastlingRight.wks = False
+        elif move.pieceCaptured == 'bR' and move.endRow == 0:
+            if move.endCol == 0:
+                self.currentCastlingRight.bqs = False
+            elif move.endCol == 7:
+                self.currentCastlingRight.bks = False
 
     '''
-    All moves considering checks
+    All moves considering checks, from moveCache when one is set and has seen the position
+    Pins and checks are found in one scan outward from the king, so every move is emitted legal
+    without making and undoing it
     '''
     def getValidMoves(self):
-        tempEnpessantPossible = self.enpessantPossible
-        tempCastleRights = CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                        self.currentCastlingRight.wqs, self.currentCastlingRight.bqs) #copy the current castling rights
+        cache = self.moveCache
+        if cache is None:
+            return self.generateValidMoves()
+        key = self.packPosition()
+        entry = cache.get(key)
+        if entry is not None:
+            packedMoves, self.checkmate, self.stalemate = entry
+            board = self.board
+            return [Move.unpack(packed, board) for packed in packedMoves]
+        moves = self.generateValidMoves()
+        cache.put(key, array('H', [move.pack() for move in moves]), self.checkmate, self.stalemate)
+        return moves
+
+    def generateValidMoves(self):
+        moves = self.generateLegalMoves('all')
+        if len(moves) == 0: #checkmate or stalemate
+            if self.inCheck():
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return moves
+
+    '''
+    The legal captures, en pessant captures and promotions, for a search that tries them before any quiet move
+    '''
+    def generateTacticalMoves(self):
+        return self.generateLegalMoves('tactical')
+
+    '''
+    The legal moves generateTacticalMoves leaves out, castling included
+    '''
+    def generateQuietMoves(self):
+        return self.generateLegalMoves('quiet')
+
+    '''
+    The quiet move with the given moveID if it is legal here, otherwise None, without generating any moves
+    Lets a search try its hash and killer moves before the quiet moves are generated; castling is not recognised
+    and is left to generateQuietMoves
+    '''
+    def legalQuietMove(self, moveID):
+        if moveID >> 12: #promotions are tactical
+            return None
+        startRow, startCol = divmod(moveID & 63, 8)
+        endRow, endCol = divmod(moveID >> 6, 8)
+        board = self.board
+        piece = board[startRow][startCol]
+        ally = 'w' if self.whiteToMove else 'b'
+        if piece[0] != ally or board[endRow][endCol] != '--':
+            return None
+        dr = endRow - startRow
+        dc = endCol - startCol
+        pieceType = piece[1]
+        if pieceType == 'p':
+            step, pawnRow = (-1, 6) if ally == 'w' else (1, 1)
+            if dc != 0 or endRow == 0 or endRow == 7:
+                return None
+            if dr != step and (dr != 2 * step or startRow != pawnRow or board[startRow + step][startCol] != '--'):
+                return None
+        elif pieceType == 'N':
+            if dr * dr + dc * dc != 5:
+                return None
+        elif pieceType == 'K':
+            if abs(dr) > 1 or abs(dc) > 1:
+                return None
+        else:
+            if (dr != 0 and dc != 0 and abs(dr) != abs(dc)) or (pieceType == 'R' and dr != 0 and dc != 0) or \
+                    (pieceType == 'B' and (dr == 0 or dc == 0)):
+                return None
+            stepRow = (dr > 0) - (dr < 0)
+            stepCol = (dc > 0) - (dc < 0)
+            for i in range(1, max(abs(dr), abs(dc))):
+                if board[startRow + stepRow * i][startCol + stepCol * i] != '--':
+                    return None
+        move = Move((startRow, startCol), (endRow, endCol), board)
+        self.makeMove(move)
+        kingRow, kingCol = self.wKingLoc if ally == 'w' else self.bKingLoc
+        legal = not self.isAttackedBy(kingRow, kingCol, self.enemyPiece[ally == 'w'])
+        self.undoMove()
+        return move if legal else None
+
+    '''
+    Legal moves of one stage: 'all', 'tactical' or 'quiet'; the checkmate and stalemate flags are left alone
+    '''
+    def generateLegalMoves(self, stage):
+        moves = []
+        if self.whiteToMove:
+            ally = 'w'
+            kingRow, kingCol = self.wKingLoc
+        else:
+            ally = 'b'
+            kingRow, kingCol = self.bKingLoc
+        inCheck, pins, checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        self.pins = pins
+        self.checks = checks
+
+        validSquares = None #squares a non king piece may move to when in check
+        if len(checks) == 1:
+            checkRow, checkCol, dirRow, dirCol = checks[0]
+            if self.board[checkRow][checkCol][1] == 'N': #knight check can only be stopped by capturing the knight
+                validSquares = {(checkRow, checkCol)}
+            else: #block anywhere along the ray or capture the checker
+                validSquares = set()
+                for i in range(1, 8):
+                    square = (kingRow + dirRow * i, kingCol + dirCol * i)
+                    validSquares.add(square)
+                    if square == (checkRow, checkCol):
+                        break
+
+        if stage == 'all':
+            moveFunctions = self.moveFunctions
+        else: #one generator for every piece type, walking only the squares of the stage
+            generate = self.getPieceCaptures if stage == 'tactical' else self.getPieceQuiets
+            moveFunctions = None
+        if len(checks) >= 2: #in double check only the king can move
+            self.getLegalKingMoves(kingRow, kingCol, moves, stage)
+        else:
+            for r, c in self.pieceLocations[ally]:
+                piece = self.board[r][c][1]
+                if piece == 'K':
+                    self.getLegalKingMoves(r, c, moves, stage)
+                    continue
+                first = len(moves)
+                if moveFunctions is not None:
+                    moveFunctions[piece](self, r, c, moves)
+                else:
+                    generate(r, c, moves)
+                pin = pins.get((r, c))
+                for i in range(len(moves) - 1, first - 1, -1):
+                    move = moves[i]
+                    if pin is not None and not self.isAlongPin(move, pin):
+                        del moves[i]
+                    elif move.isEnpessantMove:
+                        if not self.isEnpessantLegal(move, kingRow, kingCol):
+                            del moves[i]
+                    elif validSquares is not None and (move.endRow, move.endCol) not in validSquares:
+                        del moves[i]
+
+        if not inCheck and stage != 'tactical':
+            self.getCastleMoves(kingRow, kingCol, moves)
+
+        return moves
+
+    '''
+    Reference move generator that plays every pseudo legal move and rejects the ones leaving the king in check
+    Kept to cross check and benchmark getValidMoves
+    '''
+    def getValidMovesByMakeUndo(self):
         # 1. generate all possible moves
         moves = self.getAllPossibleMoves()
         if self.whiteToMove:
@@ -179,9 +671,6 @@ class GameState():
             self.checkmate = False
             self.stalemate = False
 
-        self.enpessantPossible = tempEnpessantPossible
-        self.currentCastlingRight = tempCastleRights
-
         return moves
 
     '''
@@ -199,27 +688,184 @@ class GameState():
     '''
 
     def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove  # switch to opp's POV
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove  # switch turns back
+        return self.isAttackedBy(r, c, self.enemyPiece[self.whiteToMove])
 
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c:  # square is under attack
+    '''
+    Determine if any piece of the given color ('w' or 'b') attacks the square r, c
+    Scans outward from the square along knight jumps, pawn and king steps and slider rays
+    and stops at the first attacker without building any moves
+    '''
+    def isAttackedBy(self, r, c, color):
+        board = self.board
+        for dr, dc in self.knightJumps:
+            endRow = r + dr
+            endCol = c + dc
+            if 0 <= endRow <= 7 and 0 <= endCol <= 7 and board[endRow][endCol][0] == color and \
+                    board[endRow][endCol][1] == 'N':
+                return True
+        pawnRow = r + 1 if color == 'w' else r - 1 #white pawns attack upwards so they sit below the square
+        if 0 <= pawnRow <= 7:
+            if c - 1 >= 0 and board[pawnRow][c - 1][0] == color and board[pawnRow][c - 1][1] == 'p':
                 return True
+            if c + 1 <= 7 and board[pawnRow][c + 1][0] == color and board[pawnRow][c + 1][1] == 'p':
+                return True
+        for j in range(8):
+            dr, dc = self.directions[j]
+            slider = 'R' if j <= 3 else 'B'
+            endRow = r + dr
+            endCol = c + dc
+            distance = 1
+            while 0 <= endRow <= 7 and 0 <= endCol <= 7:
+                endPiece = board[endRow][endCol]
+                if endPiece != '--':
+                    if endPiece[0] == color and (endPiece[1] == slider or endPiece[1] == 'Q' or
+                                                 (distance == 1 and endPiece[1] == 'K')):
+                        return True
+                    break #first piece on the ray blocks everything behind it
+                endRow += dr
+                endCol += dc
+                distance += 1
         return False
 
+    '''
+    Batch form of isAttackedBy: an 8x8 map holding how many pieces of the given color attack each square
+    '''
+    def getAttackMap(self, color):
+        board = self.board
+        attacks = [[0] * 8 for i in range(8)]
+        pawnStep = -1 if color == 'w' else 1
+        for r, c in self.pieceLocations[color]:
+            pieceType = board[r][c][1]
+            if pieceType == 'p':
+                endRow = r + pawnStep
+                if 0 <= endRow <= 7:
+                    if c - 1 >= 0:
+                        attacks[endRow][c - 1] += 1
+                    if c + 1 <= 7:
+                        attacks[endRow][c + 1] += 1
+            elif pieceType == 'N' or pieceType == 'K':
+                steps = self.knightJumps if pieceType == 'N' else self.directions
+                for dr, dc in steps:
+                    endRow = r + dr
+                    endCol = c + dc
+                    if 0 <= endRow <= 7 and 0 <= endCol <= 7:
+                        attacks[endRow][endCol] += 1
+            else: #sliders, rooks use the first 4 directions, bishops the last 4, queens all 8
+                first = 4 if pieceType == 'B' else 0
+                last = 4 if pieceType == 'R' else 8
+                for j in range(first, last):
+                    dr, dc = self.directions[j]
+                    endRow = r + dr
+                    endCol = c + dc
+                    while 0 <= endRow <= 7 and 0 <= endCol <= 7:
+                        attacks[endRow][endCol] += 1
+                        if board[endRow][endCol] != '--':
+                            break
+                        endRow += dr
+                        endCol += dc
+        return attacks
+
+    '''
+    Scan outward from the king at (r, c) along every line and knight jump
+    Returns whether the king is in check, the pinned allied pieces mapped to their pin direction
+    and the checking pieces as (row, col, dirRow, dirCol)
+    '''
+    def checkForPinsAndChecks(self, r, c):
+        pins = {}
+        checks = []
+        inCheck = False
+        ally = self.board[r][c][0]
+        enemy = 'b' if ally == 'w' else 'w'
+        for j in range(len(self.directions)):
+            d = self.directions[j]
+            possiblePin = None
+            for i in range(1, 8):
+                endRow = r + d[0] * i
+                endCol = c + d[1] * i
+                if not (0 <= endRow <= 7 and 0 <= endCol <= 7):
+                    break
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == ally and endPiece[1] != 'K':
+                    if possiblePin is None: #first allied piece could be pinned
+                        possiblePin = (endRow, endCol)
+                    else: #second allied piece, so no pin or check in this direction
+                        break
+                elif endPiece[0] == enemy:
+                    pieceType = endPiece[1]
+                    # 1. orthogonally away from king and piece is a rook
+                    # 2. diagonally away from king and piece is a bishop
+                    # 3. 1 square away diagonally from king and piece is a pawn attacking towards the king
+                    # 4. any direction and piece is a queen
+                    # 5. any direction 1 square away and piece is a king
+                    if (j <= 3 and pieceType == 'R') or (j >= 4 and pieceType == 'B') or \
+                            (i == 1 and pieceType == 'p' and ((enemy == 'w' and j >= 6) or (enemy == 'b' and 4 <= j <= 5))) or \
+                            pieceType == 'Q' or (i == 1 and pieceType == 'K'):
+                        if possiblePin is None: #no piece blocking, so check
+                            inCheck = True
+                            checks.append((endRow, endCol, d[0], d[1]))
+                        else: #piece blocking so pin
+                            pins[possiblePin] = d
+                    break #enemy piece not applying check or pin
+        for m in self.knightJumps:
+            endRow = r + m[0]
+            endCol = c + m[1]
+            if 0 <= endRow <= 7 and 0 <= endCol <= 7:
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == enemy and endPiece[1] == 'N': #enemy knight attacking the king
+                    inCheck = True
+                    checks.append((endRow, endCol, m[0], m[1]))
+        return inCheck, pins, checks
+
+    '''
+    A pinned piece may only move along the line between its king and the pinning piece
+    '''
+    def isAlongPin(self, move, pin):
+        return (move.endRow - move.startRow) * pin[1] == (move.endCol - move.startCol) * pin[0]
+
+    '''
+    En pessant removes two pawns from the same rank, which can expose the king in ways a normal pin scan misses
+    so the capture is tried on the board and the king square tested again
+    '''
+    def isEnpessantLegal(self, move, kingRow, kingCol):
+        self.board[move.startRow][move.startCol] = '--'
+        self.board[move.startRow][move.endCol] = '--'
+        self.board[move.endRow][move.endCol] = move.pieceMoved
+        inCheck = self.isAttackedBy(kingRow, kingCol, move.pieceCaptured[0])
+        self.board[move.startRow][move.startCol] = move.pieceMoved
+        self.board[move.startRow][move.endCol] = move.pieceCaptured
+        self.board[move.endRow][move.endCol] = '--'
+        return not inCheck
+
+    '''
+    Get the king moves that do not walk into check
+    The king is lifted off the board while testing so it cannot shield its target square from a slider
+    '''
+    def getLegalKingMoves(self, r, c, moves, stage='all'):
+        king = self.board[r][c]
+        enemy = self.enemyPiece[king[0] == 'w']
+        targets = []
+        self.board[r][c] = '--'
+        for dr, dc in self.directions:
+            endRow = r + dr
+            endCol = c + dc
+            if 0 <= endRow <= 7 and 0 <= endCol <= 7:
+                target = self.board[endRow][endCol]
+                if target[0] != king[0] and (stage == 'all' or (target == '--') == (stage == 'quiet')) and \
+                        not self.isAttackedBy(endRow, endCol, enemy):
+                    targets.append((endRow, endCol))
+        self.board[r][c] = king
+        for endSq in targets:
+            moves.append(Move((r, c), endSq, self.board))
+
     '''
     All moves without considering checks
     '''
 
     def getAllPossibleMoves(self):
         moves = []  # Move((6,4), (4,4), self.board)
-        for r in range(len(self.board)):
-            for c in range(len(self.board[r])):
-                color = self.board[r][c][0]  # the first character is always 'w' or 'b', aka whose piece it is
-                if (color == 'w' and self.whiteToMove) or (color == 'b' and not self.whiteToMove):
-                    piece = self.board[r][c][1]  # the second character is always the name of the piece
-                    self.moveFunctions[piece](r, c, moves)  # calls appropriate move function based on piece type
+        for r, c in self.pieceLocations['w' if self.whiteToMove else 'b']: #only the squares the side's pieces are on
+            piece = self.board[r][c][1]  # the second character is always the name of the piece
+            self.moveFunctions[piece](self, r, c, moves)  # calls appropriate move function based on piece type
 
         return moves
 
@@ -230,37 +876,47 @@ class GameState():
     def getPawnMoves(self, r, c, moves):
         if self.whiteToMove:  # white pawn moves
             if self.board[r - 1][c] == '--':  # 1 square pawn advance
-                moves.append(Move((r, c), (r - 1, c), self.board))
+                self.addPawnMove((r, c), (r - 1, c), moves)
                 if r == 6 and self.board[r - 2][c] == '--':  # 2 square pawn advance
                     moves.append(Move((r, c), (r - 2, c), self.board))
             if c - 1 >= 0:  # capture to left
                 if self.board[r - 1][c - 1][0] == 'b':  # enemy piece to capture
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board))
+                    self.addPawnMove((r, c), (r - 1, c - 1), moves)
                 elif (r-1, c-1) == self.enpessantPossible:
                     moves.append(Move((r, c), (r - 1, c - 1), self.board, isEnpessantMove=True))
 
             if c + 1 <= 7:  # capture to right
                 if self.board[r - 1][c + 1][0] == 'b':  # enemy piece to capture
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board))
+                    self.addPawnMove((r, c), (r - 1, c + 1), moves)
                 elif (r-1, c+1) == self.enpessantPossible:
                     moves.append(Move((r, c), (r - 1, c + 1), self.board, isEnpessantMove=True))
         else:  # black pawn moves
             if self.board[r + 1][c] == '--':  # 1 square pawn advance
-                moves.append(Move((r, c), (r + 1, c), self.board))
+                self.addPawnMove((r, c), (r + 1, c), moves)
                 if r == 1 and self.board[r + 2][c] == '--':  # 2 square pawn advance
                     moves.append(Move((r, c), (r + 2, c), self.board))
             if c - 1 >= 0:  # capture to black's right
                 if self.board[r + 1][c - 1][0] == 'w':  # enemy piece to capture
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board))
+                    self.addPawnMove((r, c), (r + 1, c - 1), moves)
                 elif (r+1, c-1) == self.enpessantPossible:
                     moves.append(Move((r, c), (r + 1, c - 1), self.board, isEnpessantMove=True))
 
             if c + 1 <= 7:  # capture to black's left
                 if self.board[r + 1][c + 1][0] == 'w':  # enemy piece to capture
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board))
+                    self.addPawnMove((r, c), (r + 1, c + 1), moves)
                 elif (r+1, c+1) == self.enpessantPossible:
                     moves.append(Move((r, c), (r + 1, c + 1), self.board, isEnpessantMove=True))
 
+    '''
+    Add a pawn move, or one move per promotion piece when the pawn reaches the last rank
+    '''
+    def addPawnMove(self, startSq, endSq, moves):
+        if endSq[0] == 0 or endSq[0] == 7:
+            for piece in Move.promotionPieces:
+                moves.append(Move(startSq, endSq, self.board, promotionChoice=piece))
+        else:
+            moves.append(Move(startSq, endSq, self.board))
+
     '''
     Get all the rook moves for the rook located at row, col and add these moves to the list
     '''
@@ -332,6 +988,77 @@ class GameState():
                     else:
                         toContinue = False
 
+    '''
+    Captures and promotions of the non king piece at r, c, pins and checks not considered
+    Sliders stop at the first piece on each ray, so no Move is made for the empty squares before it
+    '''
+    def getPieceCaptures(self, r, c, moves):
+        board = self.board
+        piece = board[r][c]
+        enemy = self.enemyPiece[piece[0] == 'w']
+        pieceType = piece[1]
+        if pieceType == 'p':
+            endRow = r - 1 if piece[0] == 'w' else r + 1
+            if (endRow == 0 or endRow == 7) and board[endRow][c] == '--': #a push onto the last rank promotes
+                self.addPawnMove((r, c), (endRow, c), moves)
+            for endCol in (c - 1, c + 1):
+                if 0 <= endCol <= 7:
+                    if board[endRow][endCol][0] == enemy:
+                        self.addPawnMove((r, c), (endRow, endCol), moves)
+                    elif (endRow, endCol) == self.enpessantPossible:
+                        moves.append(Move((r, c), (endRow, endCol), board, isEnpessantMove=True))
+        elif pieceType == 'N':
+            for dr, dc in self.knightJumps:
+                endRow = r + dr
+                endCol = c + dc
+                if 0 <= endRow <= 7 and 0 <= endCol <= 7 and board[endRow][endCol][0] == enemy:
+                    moves.append(Move((r, c), (endRow, endCol), board))
+        else: #rooks use the first 4 directions, bishops the last 4, queens all 8
+            first = 4 if pieceType == 'B' else 0
+            last = 4 if pieceType == 'R' else 8
+            for j in range(first, last):
+                dr, dc = self.directions[j]
+                endRow = r + dr
+                endCol = c + dc
+                while 0 <= endRow <= 7 and 0 <= endCol <= 7:
+                    if board[endRow][endCol] != '--':
+                        if board[endRow][endCol][0] == enemy:
+                            moves.append(Move((r, c), (endRow, endCol), board))
+                        break
+                    endRow += dr
+                    endCol += dc
+
+    '''
+    Moves of the non king piece at r, c to empty squares that do not promote, pins and checks not considered
+    '''
+    def getPieceQuiets(self, r, c, moves):
+        board = self.board
+        pieceType = board[r][c][1]
+        if pieceType == 'p':
+            step, startRow = (-1, 6) if self.whiteToMove else (1, 1)
+            endRow = r + step
+            if endRow != 0 and endRow != 7 and board[endRow][c] == '--':
+                moves.append(Move((r, c), (endRow, c), board))
+                if r == startRow and board[endRow + step][c] == '--':
+                    moves.append(Move((r, c), (endRow + step, c), board))
+        elif pieceType == 'N':
+            for dr, dc in self.knightJumps:
+                endRow = r + dr
+                endCol = c + dc
+                if 0 <= endRow <= 7 and 0 <= endCol <= 7 and board[endRow][endCol] == '--':
+                    moves.append(Move((r, c), (endRow, endCol), board))
+        else:
+            first = 4 if pieceType == 'B' else 0
+            last = 4 if pieceType == 'R' else 8
+            for j in range(first, last):
+                dr, dc = self.directions[j]
+                endRow = r + dr
+                endCol = c + dc
+                while 0 <= endRow <= 7 and 0 <= endCol <= 7 and board[endRow][endCol] == '--':
+                    moves.append(Move((r, c), (endRow, endCol), board))
+                    endRow += dr
+                    endCol += dc
+
     '''
     Get all the Queen moves for the queen located at row, col and add these moves to the list
     '''
@@ -373,7 +1100,50 @@ class GameState():
     def getQueensideCastleMoves(self, r, c, moves):
         if self.board[r][c-1] == '--' and self.board[r][c-2] == '--' and self.board[r][c-3] == '--':
             if not self.squareUnderAttack(r, c-1) and not self.squareUnderAttack(r, c-2):
-                moves.append(Move((r, c), (r, c+2), self.board, isCastleMove=True))
+                moves.append(Move((r, c), (r, c-2), self.board, isCastleMove=True))
+
+GameState.bindMoveFunctions()
+
+'''
+Bounded least recently used cache of legal move lists by packPosition, shared by every GameState it is set on
+Moves are kept as an array of 16 bit Move.pack() values with the checkmate and stalemate flags, about 2 bytes a move
+instead of a Move object, and rebuilt against the board on a hit
+Copying a GameState shares its cache rather than copying it
+'''
+class LegalMoveCache():
+    def __init__(self, size=1 << 16):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, packedMoves, checkmate, stalemate):
+        self.entries[key] = (packedMoves, checkmate, stalemate)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self.entries), "size": self.size, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hitRate": self.hits / lookups if lookups else 0.0,
+                "movesStored": sum(len(entry[0]) for entry in self.entries.values())}
 
 class CastleRights():
     def __init__(self, wks, bks, wqs, bqs):
@@ -381,6 +1151,26 @@ class CastleRights():
         self.bks = bks
         self.wqs = wqs
         self.bqs = bqs
+
+    '''
+    The rights as a 4 bit mask: 1 white kingside, 2 white queenside, 4 black kingside, 8 black queenside
+    '''
+    def mask(self):
+        return self.wks | self.wqs << 1 | self.bks << 2 | self.bqs << 3
+
+    @staticmethod
+    def fromMask(mask):
+        return CastleRights(bool(mask & 1), bool(mask & 4), bool(mask & 2), bool(mask & 8))
+
+    '''
+    Set the rights from a mask in place, so restoring them on undo allocates nothing
+    '''
+    def setMask(self, mask):
+        self.wks = bool(mask & 1)
+        self.wqs = bool(mask & 2)
+        self.bks = bool(mask & 4)
+        self.bqs = bool(mask & 8)
+
 class Move():
     # maps keys to values
     # key : value
@@ -392,22 +1182,39 @@ class Move():
                    "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
-    def __init__(self, startSq, endSq, board, isEnpessantMove=False, isCastleMove=False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        self.isPawnPromotion = (self.pieceMoved == 'wp' and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7)
+    # packed 16 bit move: bits 0-5 start square, 6-11 end square (square = row * 8 + col),
+    # 12-13 promotion piece, 14 en pessant flag, 15 castle flag
+    # the low 14 bits are the moveID, which is all that identifies a move in a given position
+    promotionPieces = ('Q', 'R', 'B', 'N')
+    ID_MASK = (1 << 14) - 1
+    ENPESSANT_FLAG = 1 << 14
+    CASTLE_FLAG = 1 << 15
+
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCaptured',
+                 'isPawnPromotion', 'promotionChoice', 'isEnpessantMove', 'isCastleMove', 'moveID')
+
+    def __init__(self, startSq, endSq, board, isEnpessantMove=False, isCastleMove=False, promotionChoice='Q'):
+        startRow, startCol = startSq
+        endRow, endCol = endSq
+        self.startRow = startRow
+        self.startCol = startCol
+        self.endRow = endRow
+        self.endCol = endCol
+        pieceMoved = board[startRow][startCol]
+        self.pieceMoved = pieceMoved
+        self.isPawnPromotion = pieceMoved[1] == 'p' and (endRow == 0 or endRow == 7)
+        self.promotionChoice = promotionChoice
         self.isEnpessantMove = isEnpessantMove
-        if self.isEnpessantMove:
-            self.pieceCaptured = 'wp' if self.pieceMoved == 'bp' else 'bp'
+        if isEnpessantMove:
+            self.pieceCaptured = 'wp' if pieceMoved == 'bp' else 'bp'
+        else:
+            self.pieceCaptured = board[endRow][endCol]
         #castle move
         self.isCastleMove = isCastleMove
 
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
-        # print(self.moveID)
+        self.moveID = startRow * 8 + startCol | (endRow * 8 + endCol) << 6
+        if promotionChoice != 'Q':
+            self.moveID |= self.promotionPieces.index(promotionChoice) << 12
 
     '''
     Overriding the equals method
@@ -418,8 +1225,47 @@ class Move():
             return self.moveID == other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
+    '''
+    The move packed into 16 bits, moveID plus the en pessant and castle flags
+    '''
+    def pack(self):
+        packed = self.moveID
+        if self.isEnpessantMove:
+            packed |= self.ENPESSANT_FLAG
+        if self.isCastleMove:
+            packed |= self.CASTLE_FLAG
+        return packed
+
+    '''
+    Rebuild a move from its packed form against the board of the position it was made in
+    '''
+    @classmethod
+    def unpack(cls, packed, board):
+        startSq = packed & 63
+        endSq = (packed >> 6) & 63
+        return cls((startSq >> 3, startSq & 7), (endSq >> 3, endSq & 7), board,
+                   isEnpessantMove=bool(packed & cls.ENPESSANT_FLAG), isCastleMove=bool(packed & cls.CASTLE_FLAG),
+                   promotionChoice=cls.promotionPieces[(packed >> 12) & 3])
+
     def getChessNotation(self):
         return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
 
     def getRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
+
+
+'''
+Build a GameState on the named backend: 'mailbox' (the 8x8 list of strings) or 'bitboard',
+from the start position or the given FEN
+Both keep the same board view and API, so ChessMain can run on either
+'''
+def newGameState(backend='mailbox', fen=None):
+    if backend == 'mailbox':
+        return GameState(fen)
+    if backend == 'bitboard':
+        from Chess.BitboardEngine import BitboardGameState
+        return BitboardGameState(fen)
+    raise ValueError("unknown GameState backend: " + backend)
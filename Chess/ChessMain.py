@@ -1,13 +1,19 @@
 """
 Main driver files responsible for user input and displaying current GameState object
 """
-from Chess import ChessEngine
+from Chess import ChessEngine, EngineWorker, Profiler
 import pygame as p
 
 WIDTH = HEIGHT = 512
 DIMENSION = 8 #dimensions of chess board are 8x8
 SQ_SIZE = HEIGHT // DIMENSION
 MAX_FPS = 15 #for animation
+OVERLAY_SQUARES = 4 #squares of the top row the overlay text may cover
+BACKEND = 'mailbox' #GameState backend: 'mailbox' or 'bitboard'
+AI_COLOR = None #'w' or 'b' to have the engine play that side
+AI_TIME_LIMIT = 1.0 #seconds the engine thinks per move
+MOVE_CACHE_SIZE = 1 << 12 #positions whose legal moves are kept, so undo and replays skip regenerating them
+PROFILE_REPORT = "profile.json" #written when profiling is switched off with 'p'
 IMAGES = {}
 
 '''
@@ -29,19 +35,26 @@ def main():
     screen = p.display.set_mode((WIDTH,HEIGHT))
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
-    gs = ChessEngine.GameState()
+    ChessEngine.GameState.moveCache = ChessEngine.LegalMoveCache(MOVE_CACHE_SIZE)
+    gs = ChessEngine.newGameState(BACKEND)
     validMoves = gs.getValidMoves()
     moveMade = False #flag variable for when a valid move is made and gamestate actually changes
 
     animate = False # flag variable for when we should animate a move
     loadImages() #only do once, before while loop
+    renderer = BoardRenderer(screen)
+    engine = EngineWorker.EngineWorker()
+    pending = None #what the engine is working on: None, 'moves' or 'search'
     running = True
     sqSelected = () #no square is selected, keep track of last click of user (tuple: row, col)
     playerClicks = [] #keep track of player clicks (two tuples: [(6,4), (4,4)])
     gameOver = False
+    profiler = None #Profiler while 'p' has switched profiling on
 
     print(validMoves)
-
+    if AI_COLOR == 'w':
+        engine.submitSearch(gs, timeLimit=AI_TIME_LIMIT)
+        pending = 'search'
 
     while running:
         for e in p.event.get():
@@ -49,7 +62,7 @@ def main():
                 running = False
             #mouse handler
             elif e.type == p.MOUSEBUTTONDOWN:
-                if not gameOver:
+                if not gameOver and pending is None and not engineToMove(gs):
                     location = p.mouse.get_pos() #(x,y location of mouse)
                     col = location[0] // SQ_SIZE
                     row = location[1] // SQ_SIZE
@@ -74,20 +87,33 @@ def main():
                     #key handler
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z: #undo when 'z' is pressed
+                    engine.cancel()
+                    pending = None
                     gs.undoMove()
                     moveMade = True
                     animate = False
                 if e.key == p.K_r: #reset the board when r is pressed
-                    gs = ChessEngine.GameState()
-                    validMoves = gs.getValidMoves()
+                    engine.cancel()
+                    gs = ChessEngine.newGameState(BACKEND)
                     sqSelected = ()
                     playerClicks = []
-                    moveMade = False
+                    moveMade = True #fetch the new move list through the engine like after any move
                     animate = False
+                    gameOver = False
+                if e.key == p.K_p: #switch profiling of the engine's hot paths on or off
+                    if profiler is None:
+                        profiler = Profiler.Profiler().enable()
+                    else:
+                        profiler.disable()
+                        profiler.dump(PROFILE_REPORT)
+                        print("profile written to " + PROFILE_REPORT)
+                        profiler = None
         if moveMade:
             if animate:
-                animateMove(gs.moveLog[-1], screen, gs.board, clock)
-            validMoves = gs.getValidMoves()
+                renderer.animateMove(gs.moveLog[-1], gs.board, clock)
+            validMoves = [] #nothing is selectable until the engine hands back the new list
+            engine.submitValidMoves(gs)
+            pending = 'moves'
             # print("\nUpdated Valid Moves:")
             # count = 0
             # for i in range(len(validMoves)):
@@ -97,54 +123,187 @@ def main():
             moveMade = False
             animate = False
 
-        drawGameState(screen, gs, validMoves, sqSelected)
+        result = engine.poll() #never blocks, the board keeps drawing while the engine works
+        if result is not None:
+            if pending == 'moves':
+                validMoves, gs.checkmate, gs.stalemate = result
+                pending = None
+                if engineToMove(gs) and validMoves:
+                    engine.submitSearch(gs, timeLimit=AI_TIME_LIMIT)
+                    pending = 'search'
+            elif pending == 'search':
+                pending = None
+                for i in range(len(validMoves)):
+                    if result.bestMove == validMoves[i]:
+                        gs.makeMove(validMoves[i])
+                        moveMade = True
+                        animate = True
 
+        message = None
         if gs.checkmate:
             gameOver = True
             if gs.whiteToMove:
-                drawText(screen, 'Black wins by checkmate')
+                message = 'Black wins by checkmate'
             else:
-                drawText(screen, 'White wins by checkmate')
+                message = 'White wins by checkmate'
         elif gs.stalemate:
             gameOver = True
-            drawText(screen, 'Stalemate')
+            message = 'Stalemate'
+        overlay = None
+        if profiler is not None:
+            overlay = "frame %.1f ms  movegen %.2f ms" % (clock.get_rawtime(), profiler.averageMs('generateValidMoves'))
+        renderer.render(gs, validMoves, sqSelected, message, overlay)
         clock.tick(MAX_FPS)
-        p.display.flip()
+    engine.shutdown()
+    if profiler is not None:
+        profiler.disable()
+    print("legal move cache:", ChessEngine.GameState.moveCache.stats())
 
 '''
-Highlight square selected and moves for piece selected
+Whether the side to move is played by the engine
+'''
+def engineToMove(gs):
+    return AI_COLOR is not None and (AI_COLOR == 'w') == gs.whiteToMove
+
+
 '''
-def highlightSquares(screen, gs, validMoves, sqSelected):
-    if sqSelected != ():
-        r, c = sqSelected
-        if gs.board[r][c][0] != (gs.enemyPiece[gs.whiteToMove]): #check if sqSelected is a piece that can be moved
+Keeps what is currently on screen for every square and repaints only the squares whose piece or highlight changed,
+pushing just those rects to the display. The board background and highlight surfaces are built once
+'''
+class BoardRenderer():
+    def __init__(self, screen):
+        self.screen = screen
+        self.background = p.Surface((WIDTH, HEIGHT))
+        drawBoard(self.background)
+        self.highlights = {}
+        for name, color in (('selected', 'blue'), ('target', 'yellow')):
             s = p.Surface((SQ_SIZE, SQ_SIZE))
             s.set_alpha(100) #transparency value -> 0 transparent; 255 opaque
-            s.fill(p.Color('blue'))
-            screen.blit(s, (c*SQ_SIZE, r*SQ_SIZE))
-            #highlight moves from that square
-            s.fill(p.Color('yellow'))
-            for move in validMoves:
-                if move.startRow == r and move.startCol == c:
-                    screen.blit(s, (SQ_SIZE*move.endCol, SQ_SIZE*move.endRow))
+            s.fill(p.Color(color))
+            self.highlights[name] = s
+        self.squareRects = [[p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE) for c in range(DIMENSION)] for r in range(DIMENSION)]
+        self.font = None
+        self.overlayFont = None
+        self.message = None
+        self.overlayShown = False
+        self.drawn = None #(piece, highlight) currently on screen for each square, None forces a repaint
+        self.invalidate()
 
+    '''
+    Forget what is on screen so the next render repaints every square
+    '''
+    def invalidate(self):
+        self.drawn = [[None] * DIMENSION for r in range(DIMENSION)]
 
+    '''
+    Which highlight each square should show for the selected square, as a dict keyed by (row, col)
+    '''
+    def highlightFor(self, gs, validMoves, sqSelected):
+        highlight = {}
+        if sqSelected != ():
+            r, c = sqSelected
+            if gs.board[r][c][0] != (gs.enemyPiece[gs.whiteToMove]): #check if sqSelected is a piece that can be moved
+                highlight[sqSelected] = 'selected'
+                for move in validMoves:
+                    if move.startRow == r and move.startCol == c:
+                        highlight[(move.endRow, move.endCol)] = 'target'
+        return highlight
 
+    '''
+    Bring the screen up to date with the game state and return the rects that were updated
+    overlay is a line of text drawn over the top left squares every frame, such as the profiling timings
+    '''
+    def render(self, gs, validMoves, sqSelected, message=None, overlay=None):
+        if message != self.message:
+            self.message = message
+            self.invalidate() #text spans many squares, so repaint under it
+        if overlay is not None or self.overlayShown:
+            self.overlayShown = overlay is not None
+            for c in range(OVERLAY_SQUARES): #the text changes every frame, so always repaint under it
+                self.drawn[0][c] = None
+        dirty = self.updateSquares(gs.board, self.highlightFor(gs, validMoves, sqSelected))
+        if dirty and message is not None:
+            dirty.append(self.drawMessage(message))
+        if overlay is not None:
+            dirty.append(self.drawOverlay(overlay))
+        if dirty:
+            p.display.update(dirty)
+        return dirty
 
+    '''
+    Repaint the squares whose piece or highlight differs from what is on screen, without pushing them to the display
+    overrides maps (row, col) to a piece to show instead of the one on the board
+    '''
+    def updateSquares(self, board, highlight, overrides=None):
+        dirty = []
+        for r in range(DIMENSION):
+            boardRow = board[r]
+            drawnRow = self.drawn[r]
+            for c in range(DIMENSION):
+                piece = boardRow[c]
+                if overrides and (r, c) in overrides:
+                    piece = overrides[(r, c)]
+                state = (piece, highlight.get((r, c)))
+                if drawnRow[c] != state:
+                    drawnRow[c] = state
+                    dirty.append(self.drawSquare(r, c, state[0], state[1]))
+        return dirty
 
-'''
-Responsible for all the graphics within a current game state
-'''
-def drawGameState(screen, gs, validMoves, sqSelected):
-    drawBoard(screen) #draw  es onto board
-    highlightSquares(screen, gs, validMoves, sqSelected)
-    drawPieces(screen, gs.board) #draw pieces on top of squares
+    '''
+    Slide the moved piece from its start to its end square over a snapshot of the board taken once, so each frame
+    restores and redraws only the sprite's old and new rects. Events are pumped every frame and stay queued for main
+    '''
+    def animateMove(self, move, board, clock):
+        endSquare = (move.endRow, move.endCol)
+        shown = move.pieceCaptured if move.pieceCaptured != '--' and not move.isEnpessantMove else '--'
+        dirty = self.updateSquares(board, {}, {endSquare: shown}) #the board without the moving piece
+        snapshot = self.screen.copy()
+        dR = move.endRow - move.startRow
+        dC = move.endCol - move.startCol
+        framesPerSquare = 7 #frames to move one square
+        frameCount = (abs(dR) + abs(dC)) * framesPerSquare
+        sprite = IMAGES[move.pieceMoved]
+        previous = None
+        for frame in range(frameCount + 1):
+            p.event.pump()
+            r, c = (move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount)
+            rect = p.Rect(int(c*SQ_SIZE), int(r*SQ_SIZE), SQ_SIZE, SQ_SIZE)
+            if previous is not None:
+                self.screen.blit(snapshot, previous, previous)
+                dirty.append(previous)
+            self.screen.blit(sprite, rect)
+            dirty.append(rect)
+            p.display.update(dirty)
+            dirty = []
+            previous = rect
+            clock.tick(60)
+        self.drawn[move.endRow][move.endCol] = None #the sprite is left there, let the next render put the real piece
+
+    def drawSquare(self, r, c, piece, highlight=None):
+        rect = self.squareRects[r][c]
+        self.screen.blit(self.background, rect, rect)
+        if highlight is not None:
+            self.screen.blit(self.highlights[highlight], rect)
+        if piece != "--": #not empty square
+            self.screen.blit(IMAGES[piece], rect)
+        return rect
+
+    def drawMessage(self, text):
+        if self.font is None:
+            self.font = p.font.SysFont("Helvitca", 32, True, False)
+        return drawText(self.screen, text, self.font)
+
+    def drawOverlay(self, text):
+        if self.overlayFont is None:
+            self.overlayFont = p.font.SysFont("Helvitca", 18, False, False)
+        textObject = self.overlayFont.render(text, 0, p.Color('Red'))
+        rect = self.screen.blit(textObject, (2, 2))
+        return rect.clip(p.Rect(0, 0, OVERLAY_SQUARES*SQ_SIZE, SQ_SIZE)) #only the squares repainted under it
 
 '''
 Draw the squares on the board top left square is always light
 '''
 def drawBoard(screen):
-    global colors
     colors = [p.Color("white"), p.Color("gray")]
     for r in range(DIMENSION):
         for c in range(DIMENSION):
@@ -152,49 +311,15 @@ def drawBoard(screen):
             p.draw.rect(screen, color, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE,))
 
 
-'''
-Draw the pieces on the board using the current GameState.board
-'''
-def drawPieces(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-            if piece != "--": #not empty square
-                screen.blit(IMAGES[piece], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
-'''
-Animating a move
-'''
-def animateMove(move, screen, board, clock):
-    global colors
-    coords = [] #list of coords that the animation will move through
-    dR = move.endRow - move.startRow
-    dC = move.endCol - move.startCol
-    framesPerSquare = 7 #frames to move one square
-    frameCount = (abs(dR) + abs(dC)) * framesPerSquare
-    for frame in range(frameCount + 1):
-        r, c = (move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount)
-        drawBoard(screen)
-        drawPieces(screen, board)
-        #erase the piece moved from its ending square
-        color = colors[(move.endRow + move.endCol) % 2]
-        endSquare = p.Rect(move.endCol*SQ_SIZE, move.endRow*SQ_SIZE, SQ_SIZE, SQ_SIZE) #draws a square of the same color over that square, thereby 'erasing' the piece
-        p.draw.rect(screen, color, endSquare)
-        #draw captured piece onto rectangle
-        if move.pieceCaptured != '--':
-            screen.blit(IMAGES[move.pieceCaptured], endSquare)
-        #draw moving piece
-        screen.blit(IMAGES[move.pieceMoved], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip() #updates fulld isplay to screen
-        clock.tick(60)
-
-def drawText(screen, text):
-    font = p.font.SysFont("Helvitca", 32, True, False)
+def drawText(screen, text, font=None):
+    if font is None:
+        font = p.font.SysFont("Helvitca", 32, True, False)
     textObject = font.render(text, 0, p.Color('Gray'))
     textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - textObject.get_width()/2, HEIGHT/2 - textObject.get_height()/2)
     screen.blit(textObject, textLocation)
     textObject = font.render(text, 0, p.Color('Black'))
     screen.blit(textObject, textLocation.move(2,2))
+    return textLocation.inflate(4, 4).move(1, 1) #covers both the shadow and the text
 
 
 if __name__ == '__main__':
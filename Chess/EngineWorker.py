@@ -0,0 +1,87 @@
+"""
+Runs engine work off the pygame thread. Each request gets a private copy of the GameState and runs on a single
+worker thread; the caller gets a Future back and polls it once per frame, so drawing and input carry on while the
+engine thinks. cancel() abandons the current request, stopping a running search at its next budget check.
+"""
+import concurrent.futures
+import copy
+
+from Chess import Search
+
+
+class EngineWorker():
+    def __init__(self, tableSize=1 << 18, tablebases=None):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.searcher = Search.Searcher(tableSize, tablebases=tablebases)
+        self.future = None
+        self.ticket = 0 #bumped on every submit and cancel, so stale work can tell it was abandoned
+        self.stopTicket = -1 #ticket of the request stop() was called for
+
+    '''
+    Legal moves of the position; the Future's result is (validMoves, checkmate, stalemate)
+    '''
+    def submitValidMoves(self, gs):
+        return self.submit(self.validMovesTask, gs)
+
+    '''
+    Best move search with the given limits; the Future's result is a Search.SearchResult
+    onIteration is called on the worker thread with each completed iteration
+    '''
+    def submitSearch(self, gs, maxDepth=64, timeLimit=None, nodeLimit=None, onIteration=None):
+        return self.submit(self.searchTask, gs, maxDepth, timeLimit, nodeLimit, onIteration)
+
+    def submit(self, task, gs, *args):
+        self.cancel()
+        position = copy.deepcopy(gs) #the worker never touches the GameState the main loop is drawing
+        self.future = self.executor.submit(task, self.ticket, position, *args)
+        return self.future
+
+    '''
+    Abandon the current request: a queued one never starts and a running search returns early
+    '''
+    def cancel(self):
+        self.ticket += 1
+        if self.future is not None:
+            self.future.cancel()
+            self.searcher.stop()
+            self.future = None
+
+    '''
+    Make a running search return its best move so far, unlike cancel the result is still delivered
+    '''
+    def stop(self):
+        if self.future is not None:
+            self.stopTicket = self.ticket
+            self.searcher.stop()
+
+    '''
+    The result of the current request once it is done, otherwise None. Each result is handed out once
+    '''
+    def poll(self):
+        if self.future is None or not self.future.done():
+            return None
+        future = self.future
+        self.future = None
+        return future.result()
+
+    def busy(self):
+        return self.future is not None
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=True)
+
+    def validMovesTask(self, ticket, gs):
+        validMoves = gs.getValidMoves()
+        return validMoves, gs.checkmate, gs.stalemate
+
+    def searchTask(self, ticket, gs, maxDepth, timeLimit, nodeLimit, onIteration):
+        if ticket != self.ticket: #cancelled before it started
+            return None
+        def iterationDone(result):
+            if self.stopTicket == ticket: #stop() came before the search had started and cleared the flag
+                self.searcher.stop()
+            if onIteration is not None:
+                onIteration(result)
+        return self.searcher.search(gs, maxDepth=maxDepth, timeLimit=timeLimit, nodeLimit=nodeLimit,
+                                    onIteration=iterationDone)
@@ -0,0 +1,135 @@
+"""
+Static evaluation: material plus piece-square tables, tapered between a middlegame and an endgame score
+by how much non pawn material is left.
+GameState keeps mgScore, egScore and phase up to date in makeMove/undoMove, so evaluating a leaf is O(1).
+"""
+
+# material in the middlegame and the endgame
+MATERIAL = {'p': (82, 94), 'N': (337, 281), 'B': (365, 297), 'R': (477, 512), 'Q': (1025, 936), 'K': (0, 0)}
+# game phase each piece is worth, 24 with all pieces on the board and 0 with only kings and pawns
+PHASE_WEIGHTS = {'p': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+TOTAL_PHASE = 24
+
+# piece-square tables from white's point of view, rank 8 first so they index like board[r][c]
+# middlegame tables follow the Simplified Evaluation Function, the endgame ones differ only for pawns and the king
+PAWN_MG = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+     5,   5,  10,  25,  25,  10,   5,   5,
+     0,   0,   0,  20,  20,   0,   0,   0,
+     5,  -5, -10,   0,   0, -10,  -5,   5,
+     5,  10,  10, -20, -20,  10,  10,   5,
+     0,   0,   0,   0,   0,   0,   0,   0)
+PAWN_EG = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+    80,  80,  80,  80,  80,  80,  80,  80,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    30,  30,  30,  30,  30,  30,  30,  30,
+    20,  20,  20,  20,  20,  20,  20,  20,
+    10,  10,  10,  10,  10,  10,  10,  10,
+    10,  10,  10,  10,  10,  10,  10,  10,
+     0,   0,   0,   0,   0,   0,   0,   0)
+KNIGHT = (
+   -50, -40, -30, -30, -30, -30, -40, -50,
+   -40, -20,   0,   0,   0,   0, -20, -40,
+   -30,   0,  10,  15,  15,  10,   0, -30,
+   -30,   5,  15,  20,  20,  15,   5, -30,
+   -30,   0,  15,  20,  20,  15,   0, -30,
+   -30,   5,  10,  15,  15,  10,   5, -30,
+   -40, -20,   0,   5,   5,   0, -20, -40,
+   -50, -40, -30, -30, -30, -30, -40, -50)
+BISHOP = (
+   -20, -10, -10, -10, -10, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,  10,  10,   5,   0, -10,
+   -10,   5,   5,  10,  10,   5,   5, -10,
+   -10,   0,  10,  10,  10,  10,   0, -10,
+   -10,  10,  10,  10,  10,  10,  10, -10,
+   -10,   5,   0,   0,   0,   0,   5, -10,
+   -20, -10, -10, -10, -10, -10, -10, -20)
+ROOK = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+     5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+     0,   0,   0,   5,   5,   0,   0,   0)
+QUEEN = (
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+     0,   0,   5,   5,   5,   5,   0,  -5,
+   -10,   5,   5,   5,   5,   5,   0, -10,
+   -10,   0,   5,   0,   0,   0,   0, -10,
+   -20, -10, -10,  -5,  -5, -10, -10, -20)
+KING_MG = (
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -20, -30, -30, -40, -40, -30, -30, -20,
+   -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20)
+KING_EG = (
+   -50, -40, -30, -20, -20, -30, -40, -50,
+   -30, -20, -10,   0,   0, -10, -20, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -30,   0,   0,   0,   0, -30, -30,
+   -50, -30, -30, -30, -30, -30, -30, -50)
+TABLES = {'p': (PAWN_MG, PAWN_EG), 'N': (KNIGHT, KNIGHT), 'B': (BISHOP, BISHOP), 'R': (ROOK, ROOK),
+          'Q': (QUEEN, QUEEN), 'K': (KING_MG, KING_EG)}
+
+'''
+Material plus table value for every piece on every square (index row * 8 + col), signed so white is positive
+Black reads the white table mirrored top to bottom
+'''
+def buildScores(phase):
+    scores = {}
+    for pieceType, tables in TABLES.items():
+        table = tables[phase]
+        material = MATERIAL[pieceType][phase]
+        scores['w' + pieceType] = [material + table[sq] for sq in range(64)]
+        scores['b' + pieceType] = [-(material + table[(7 - sq // 8) * 8 + sq % 8]) for sq in range(64)]
+    return scores
+
+MIDGAME = buildScores(0)
+ENDGAME = buildScores(1)
+PHASE = {color + pieceType: weight for pieceType, weight in PHASE_WEIGHTS.items() for color in ('w', 'b')}
+
+'''
+The (middlegame, endgame, phase) totals of a whole board, for when a position is set up from scratch
+'''
+def evaluateBoard(board):
+    mg = 0
+    eg = 0
+    phase = 0
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if piece != '--':
+                mg += MIDGAME[piece][r * 8 + c]
+                eg += ENDGAME[piece][r * 8 + c]
+                phase += PHASE[piece]
+    return mg, eg, phase
+
+'''
+Blend the two scores: all middlegame with every piece on the board, all endgame with only kings and pawns
+'''
+def taper(mg, eg, phase):
+    phase = min(phase, TOTAL_PHASE) #extra queens from promotion do not make it more of a middlegame
+    return (mg * phase + eg * (TOTAL_PHASE - phase)) // TOTAL_PHASE
+
+'''
+Score of the position from the point of view of the side to move, from the incrementally kept totals
+'''
+def evaluate(gs):
+    score = taper(gs.mgScore, gs.egScore, gs.phase)
+    return score if gs.whiteToMove else -score
@@ -0,0 +1,272 @@
+"""
+Compact binary archive of games with an offset index, read through mmap.
+Layout: a header (magic, version, game count, index offset), the game blocks, then the index of one 8 byte offset per
+game. Each game block is its result, start FEN (empty for the start position), tag pairs and moves, each move the
+16 bit Move.pack() value, so a game costs about 2 bytes a ply. Any game is found through the index and any ply of it
+is reached by replaying just its first moves, without reading the rest of the file.
+Appending writes the new games and a new index after the old one and rewrites the header last, so an interrupted
+append leaves the file as it was; the old index stays behind as dead space.
+Run from the project root with: python -m Chess.GameRecord convert games.pgn games.cpgr
+                                python -m Chess.GameRecord pgn games.cpgr games.pgn
+                                python -m Chess.GameRecord bench games.pgn
+"""
+import argparse
+import copy
+import mmap
+import os
+import random
+import struct
+import tempfile
+import time
+
+from Chess import ChessEngine, PGN
+
+MAGIC = b'CPGR'
+VERSION = 1
+HEADER = struct.Struct('>4sHHIQ') #magic, version, reserved, game count, index offset
+GAME = struct.Struct('>BBHH') #result, start FEN length, tags length, ply count
+OFFSET = struct.Struct('>Q')
+RESULT_CODES = {result: code for code, result in enumerate(PGN.RESULTS)}
+START_FEN = ChessEngine.GameState().to_fen()
+
+
+class RecordedGame():
+    def __init__(self, moves, headers=None, result='*', fen=None):
+        self.moves = moves #Move.pack() values from the start position on
+        self.headers = headers if headers is not None else {}
+        self.result = result
+        self.fen = fen #start position, None for the standard one
+
+    '''
+    The game replayed into a new GameState, up to ply if given
+    Moves are rebuilt with Move.unpack and trusted, they were legal when recorded
+    '''
+    def toGameState(self, backend='mailbox', ply=None):
+        gs = ChessEngine.newGameState(backend, self.fen)
+        for packed in self.moves[:ply]:
+            gs.makeMove(ChessEngine.Move.unpack(packed, gs.board))
+        return gs
+
+    def writePGN(self, f):
+        headers = {tag: value for tag, value in self.headers.items() if tag not in ("FEN", "SetUp")}
+        PGN.writeGame(f, self.toGameState().moveLog, headers, self.result, self.fen)
+
+'''
+Record the moves played in a GameState, starting from the position before its first move
+'''
+def fromGameState(gs, headers=None, result='*'):
+    start = copy.deepcopy(gs)
+    for i in range(len(gs.moveLog)):
+        start.undoMove()
+    fen = start.to_fen()
+    return RecordedGame([move.pack() for move in gs.moveLog], headers, result, None if fen == START_FEN else fen)
+
+'''
+Record a parsed PGN game, resolving its SAN moves against the legal moves
+'''
+def fromPGNGame(game):
+    fen = game.headers.get("FEN")
+    gs = ChessEngine.GameState(fen)
+    moves = []
+    for san in game.moves:
+        move = PGN.sanToMove(gs, san)
+        moves.append(move.pack())
+        gs.makeMove(move)
+    headers = {tag: value for tag, value in game.headers.items() if tag not in ("FEN", "SetUp", "Result")}
+    return RecordedGame(moves, headers, game.result, fen)
+
+'''
+Tag pairs as tab separated lines; PGN tag values never hold tabs or newlines
+'''
+def encodeTags(headers):
+    return '\n'.join(tag + '\t' + value for tag, value in headers.items()).encode('utf-8')
+
+def decodeTags(data):
+    if not data:
+        return {}
+    return dict(line.split('\t', 1) for line in data.decode('utf-8').split('\n'))
+
+def encodeGame(game):
+    fen = game.fen.encode('ascii') if game.fen is not None else b''
+    tags = encodeTags(game.headers)
+    return (GAME.pack(RESULT_CODES.get(game.result, RESULT_CODES['*']), len(fen), len(tags), len(game.moves)) +
+            fen + tags + struct.pack('>%dH' % len(game.moves), *game.moves))
+
+'''
+Add games to a record file, creating it if needed; returns the number of games now in the file
+'''
+def appendGames(path, games):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, 0, HEADER.size))
+    with open(path, 'r+b') as f:
+        magic, version, reserved, count, indexOffset = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a game record file: " + path)
+        f.seek(indexOffset)
+        offsets = list(struct.unpack('>%dQ' % count, f.read(count * OFFSET.size)))
+        offset = f.seek(0, os.SEEK_END)
+        chunk = []
+        for game in games:
+            block = encodeGame(game)
+            offsets.append(offset)
+            chunk.append(block)
+            offset += len(block)
+        f.write(b''.join(chunk))
+        f.write(struct.pack('>%dQ' % len(offsets), *offsets))
+        f.flush()
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(offsets), offset))
+    return len(offsets)
+
+
+class GameRecordFile():
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, reserved, self.count, self.indexOffset = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("not a game record file: " + path)
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.game(i)
+
+    '''
+    Game i's block offset and its (result, start FEN length, tags length, ply count) header
+    '''
+    def locate(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError("game %d out of range" % i)
+        offset = OFFSET.unpack_from(self.data, self.indexOffset + i * OFFSET.size)[0]
+        return offset, GAME.unpack_from(self.data, offset)
+
+    '''
+    The first count moves of game i, all of them by default, read straight from the mapped file
+    '''
+    def moves(self, i, count=None):
+        offset, (result, fenLength, tagsLength, plies) = self.locate(i)
+        count = plies if count is None else min(count, plies)
+        return list(struct.unpack_from('>%dH' % count, self.data, offset + GAME.size + fenLength + tagsLength))
+
+    def startFen(self, offset, fenLength):
+        start = offset + GAME.size
+        return self.data[start:start + fenLength].decode('ascii') or None
+
+    def game(self, i):
+        offset, (result, fenLength, tagsLength, plies) = self.locate(i)
+        tagsStart = offset + GAME.size + fenLength
+        headers = decodeTags(self.data[tagsStart:tagsStart + tagsLength])
+        moves = list(struct.unpack_from('>%dH' % plies, self.data, tagsStart + tagsLength))
+        return RecordedGame(moves, headers, PGN.RESULTS[result], self.startFen(offset, fenLength))
+
+    '''
+    The position of game i after ply moves, reading only the moves it needs
+    '''
+    def position(self, i, ply, backend='mailbox'):
+        offset, (result, fenLength, tagsLength, plies) = self.locate(i)
+        gs = ChessEngine.newGameState(backend, self.startFen(offset, fenLength))
+        movesStart = offset + GAME.size + fenLength + tagsLength
+        for packed in struct.unpack_from('>%dH' % min(ply, plies), self.data, movesStart):
+            gs.makeMove(ChessEngine.Move.unpack(packed, gs.board))
+        return gs
+
+def convertPGN(pgnPath, recordPath, batch=1000, report=print):
+    games = []
+    count = 0
+    with open(pgnPath) as f:
+        for game in PGN.readGames(f):
+            try:
+                games.append(fromPGNGame(game))
+            except ValueError as error:
+                if report is not None:
+                    report("skipped game: %s" % error)
+            if len(games) >= batch:
+                count = appendGames(recordPath, games)
+                games = []
+    if games or count == 0:
+        count = appendGames(recordPath, games)
+    return count
+
+def writePGNFile(recordPath, pgnPath):
+    record = GameRecordFile(recordPath)
+    with open(pgnPath, 'w') as f:
+        for game in record:
+            game.writePGN(f)
+    record.close()
+
+'''
+Compare a PGN file with the same games as a record: bytes on disk, loading every game into a GameState, and loading
+random (game, ply) positions
+'''
+def benchmark(pgnPath, samples=200, seed=1):
+    directory = tempfile.mkdtemp()
+    recordPath = os.path.join(directory, "games.cpgr")
+    start = time.perf_counter()
+    count = convertPGN(pgnPath, recordPath, report=None)
+    print("converted %d games in %.2fs" % (count, time.perf_counter() - start))
+    pgnBytes = os.path.getsize(pgnPath)
+    recordBytes = os.path.getsize(recordPath)
+    record = GameRecordFile(recordPath)
+    plies = sum(len(record.moves(i)) for i in range(len(record)))
+    print("PGN    %10d bytes  %6.2f bytes/ply" % (pgnBytes, pgnBytes / max(plies, 1)))
+    print("record %10d bytes  %6.2f bytes/ply  (%.1fx smaller)" % (recordBytes, recordBytes / max(plies, 1),
+                                                                   pgnBytes / recordBytes))
+
+    start = time.perf_counter()
+    with open(pgnPath) as f:
+        for game in PGN.readGames(f):
+            try:
+                game.replay()
+            except ValueError:
+                pass
+    pgnSeconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for game in record:
+        game.toGameState()
+    recordSeconds = time.perf_counter() - start
+    print("load all games: PGN %.2fs, record %.2fs (%.1fx faster)" % (pgnSeconds, recordSeconds,
+                                                                      pgnSeconds / recordSeconds))
+
+    rng = random.Random(seed)
+    picks = []
+    for sample in range(samples):
+        i = rng.randrange(len(record))
+        picks.append((i, rng.randint(0, len(record.moves(i)))))
+    start = time.perf_counter()
+    for i, ply in picks:
+        record.position(i, ply)
+    seconds = time.perf_counter() - start
+    print("random (game, ply) positions from the record: %.2f ms each" % (seconds / samples * 1000))
+
+    record.close()
+    os.remove(recordPath)
+    os.rmdir(directory)
+
+def main():
+    parser = argparse.ArgumentParser(description="convert, export and benchmark binary game record files")
+    parser.add_argument("command", choices=("convert", "pgn", "bench"))
+    parser.add_argument("source")
+    parser.add_argument("target", nargs="?")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        print("%d games in %s" % (convertPGN(args.source, args.target), args.target))
+    elif args.command == "pgn":
+        writePGNFile(args.source, args.target)
+    else:
+        benchmark(args.source)
+
+
+if __name__ == '__main__':
+    main()
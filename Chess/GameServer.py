@@ -0,0 +1,283 @@
+"""
+Headless game server: many concurrent games in one process over a JSON-lines protocol on TCP or a Unix socket.
+Every request is one JSON object per line and gets one JSON object back with the same "id":
+    {"id": 1, "op": "new", "fen": optional}           -> {"id": 1, "ok": true, "game": "g1", "fen": ..., "status": ...}
+    {"id": 2, "op": "moves", "game": "g1"}            -> {..., "moves": ["e2e4", ...]}
+    {"id": 3, "op": "move", "game": "g1", "move": "e2e4"} -> {..., "fen": ..., "status": "ongoing"}
+    {"id": 4, "op": "undo" | "fen" | "close", "game": "g1"}
+    {"id": 5, "op": "engine", "game": "g1", "depth": 4, "movetime": 500}
+                                                      -> {..., "bestmove": "e7e5", "score": 12, "depth": 4}
+    {"id": 6, "op": "stats"}
+Failures answer {"id": ..., "ok": false, "error": "..."}. Every game shares one ChessEngine.LegalMoveCache as its
+moveCache, so moves and move requests in positions any game has seen skip move generation; engine searches run in a
+process pool so they never hold up the event loop. Games belong to the connection that created them and end with it.
+Serve with: python -m Chess.GameServer serve [--port 8765 | --unix PATH]
+Load test with: python -m Chess.GameServer load --sessions 1000 [--port 8765 | --unix PATH]
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import random
+import time
+
+from Chess import ChessEngine, Parallel, UCI
+
+DEFAULT_PORT = 8765
+CACHE_SIZE = 1 << 16 #positions whose legal moves are kept
+ENGINE_DEPTH = 4
+MAX_ENGINE_DEPTH = 8
+
+
+class ServerError(Exception):
+    pass
+
+
+class GameServer():
+    def __init__(self, backend='mailbox', cacheSize=CACHE_SIZE, engineWorkers=None):
+        self.backend = backend
+        self.games = {} #game id -> GameState
+        self.gameIds = itertools.count(1)
+        self.cache = ChessEngine.LegalMoveCache(cacheSize) #moveCache of every game
+        self.engineWorkers = engineWorkers
+        self.pool = None #engine process pool, started on the first engine request
+        self.requests = 0
+
+    def enginePool(self):
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.engineWorkers, initializer=Parallel.initWorker,
+                                                               initargs=(self.backend, 1 << 16))
+        return self.pool
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    async def handleConnection(self, reader, writer):
+        owned = set() #games created on this connection
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(await self.handleLine(line, owned))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for gameId in owned:
+                self.games.pop(gameId, None)
+            writer.close()
+
+    async def handleLine(self, line, owned):
+        requestId = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ServerError("request must be a JSON object")
+            requestId = request.get("id")
+            response = await self.handle(request, owned)
+            response["ok"] = True
+        except (ValueError, TypeError, ServerError) as error: #json.JSONDecodeError is a ValueError
+            response = {"ok": False, "error": str(error)}
+        except Exception as error: #a bug or a broken engine pool fails this request, not the connection and its games
+            response = {"ok": False, "error": "%s: %s" % (type(error).__name__, error)}
+        self.requests += 1
+        response["id"] = requestId
+        return (json.dumps(response) + "\n").encode()
+
+    async def handle(self, request, owned):
+        op = request.get("op")
+        if op == "new":
+            fen = request.get("fen")
+            if fen is not None and not isinstance(fen, str):
+                raise ServerError("fen must be a string")
+            gs = ChessEngine.newGameState(self.backend, fen) #setFen raises ValueError for a malformed FEN
+            gs.moveCache = self.cache
+            gameId = "g%d" % next(self.gameIds)
+            self.games[gameId] = gs
+            owned.add(gameId)
+            return {"game": gameId, "fen": gs.to_fen(), "status": self.status(gs)}
+        if op == "stats":
+            return {"games": len(self.games), "requests": self.requests, "cache": self.cache.stats()}
+
+        gameId = request.get("game")
+        gs = self.games.get(gameId) if gameId in owned else None #other connections' games are not visible
+        if gs is None:
+            raise ServerError("unknown game: %s" % gameId)
+        if op == "moves":
+            return {"moves": [UCI.moveToUci(move) for move in gs.getValidMoves()]}
+        if op == "move":
+            gs.makeMove(UCI.parseMove(gs, request.get("move"))) #ValueError for an illegal move
+            return {"fen": gs.to_fen(), "status": self.status(gs)}
+        if op == "undo":
+            gs.undoMove()
+            return {"fen": gs.to_fen(), "status": self.status(gs)}
+        if op == "fen":
+            return {"fen": gs.to_fen(), "status": self.status(gs)}
+        if op == "close":
+            self.games.pop(gameId, None)
+            owned.discard(gameId)
+            return {}
+        if op == "engine":
+            return await self.engineMove(gs, request)
+        raise ServerError("unknown op: %s" % op)
+
+    '''
+    ongoing, checkmate, stalemate or draw (threefold repetition or the fifty move rule)
+    '''
+    def status(self, gs):
+        gs.getValidMoves() #sets the checkmate and stalemate flags, from the cache when it has the position
+        if gs.checkmate:
+            return "checkmate"
+        if gs.stalemate:
+            return "stalemate"
+        if gs.halfmoveClock >= 100 or gs.isThreefoldRepetition():
+            return "draw"
+        return "ongoing"
+
+    async def engineMove(self, gs, request):
+        if not gs.getValidMoves():
+            raise ServerError("the game is over")
+        depth = min(int(request.get("depth", ENGINE_DEPTH)), MAX_ENGINE_DEPTH)
+        timeLimit = request["movetime"] / 1000 if "movetime" in request else None
+        packed = gs.packPosition()
+        task = (packed, depth, timeLimit, None, None)
+        loop = asyncio.get_running_loop()
+        try:
+            scores, pv, nodes, reached = await loop.run_in_executor(self.enginePool(), Parallel.searchTask, task)
+        except concurrent.futures.BrokenExecutor:
+            self.pool = None #a worker died, start a fresh pool on the next engine request
+            raise ServerError("the engine process failed")
+        if gs.packPosition() != packed: #the game moved on while the engine was searching
+            raise ServerError("the position changed during the engine search")
+        if not pv:
+            raise ServerError("the engine found no move")
+        #score is None, sent as null, when movetime ran out before depth 1 and bestmove is only a fallback
+        return {"bestmove": UCI.moveToUci(ChessEngine.Move.unpack(pv[0], gs.board)),
+                "score": scores[-1] if scores else None, "depth": reached, "nodes": nodes}
+
+async def serve(server, host, port, unixPath):
+    if unixPath is not None:
+        listener = await asyncio.start_unix_server(server.handleConnection, unixPath)
+        print("serving on " + unixPath)
+    else:
+        listener = await asyncio.start_server(server.handleConnection, host, port)
+        print("serving on %s:%d" % (host, port))
+    async with listener:
+        await listener.serve_forever()
+
+'''
+A client connection that can have many requests in flight; answers are matched to requests by id
+'''
+class Client():
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.ids = itertools.count(1)
+        self.readerTask = asyncio.ensure_future(self.readResponses())
+
+    @classmethod
+    async def connect(cls, host, port, unixPath):
+        if unixPath is not None:
+            reader, writer = await asyncio.open_unix_connection(unixPath)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def readResponses(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self.pending.pop(response["id"], None)
+            if future is not None and not future.done():
+                future.set_result(response)
+        for future in self.pending.values():
+            future.set_exception(ConnectionError("server closed the connection"))
+
+    async def request(self, op, **fields):
+        requestId = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[requestId] = future
+        fields["id"] = requestId
+        fields["op"] = op
+        self.writer.write((json.dumps(fields) + "\n").encode())
+        response = await future
+        if not response["ok"]:
+            raise ServerError(response["error"])
+        return response
+
+    async def close(self):
+        self.writer.close()
+        self.readerTask.cancel()
+
+'''
+One simulated player: starts a game and plays random legal moves, timing every move request
+'''
+async def playSession(client, plies, latencies, rng):
+    game = (await client.request("new"))["game"]
+    for ply in range(plies):
+        moves = (await client.request("moves", game=game))["moves"]
+        if not moves:
+            break
+        start = time.perf_counter()
+        response = await client.request("move", game=game, move=rng.choice(moves))
+        latencies.append(time.perf_counter() - start)
+        if response["status"] != "ongoing":
+            break
+    await client.request("close", game=game)
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def loadTest(host, port, unixPath, sessions, connections, plies, seed):
+    clients = [await Client.connect(host, port, unixPath) for i in range(min(connections, sessions))]
+    latencies = []
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    await asyncio.gather(*(playSession(clients[i % len(clients)], plies, latencies, rng) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    stats = await clients[0].request("stats")
+    for client in clients:
+        await client.close()
+
+    latencies.sort()
+    print("%d sessions over %d connections, %d moves in %.2fs (%.0f moves/sec)" % (
+        sessions, len(clients), len(latencies), elapsed, len(latencies) / elapsed))
+    for label, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)):
+        print("move latency %s %8.2f ms" % (label, percentile(latencies, fraction) * 1000))
+    print("legal move cache: %d hits, %d misses" % (stats["cache"]["hits"], stats["cache"]["misses"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON-lines game server and its load generator")
+    parser.add_argument("mode", choices=("serve", "load"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", metavar="PATH", help="use a Unix socket instead of TCP")
+    parser.add_argument("--backend", default="mailbox", help="GameState backend: mailbox or bitboard")
+    parser.add_argument("--engine-workers", type=int, help="engine processes, one per CPU by default")
+    parser.add_argument("--sessions", type=int, default=100, help="games the load generator plays at once")
+    parser.add_argument("--connections", type=int, default=16, help="connections the sessions are spread over")
+    parser.add_argument("--plies", type=int, default=40, help="moves each load generator game plays at most")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.mode == "load":
+        asyncio.run(loadTest(args.host, args.port, args.unix, args.sessions, args.connections, args.plies, args.seed))
+        return
+    server = GameServer(args.backend, engineWorkers=args.engine_workers)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Move ordering for the alpha-beta search, with the moves generated in stages as the search gets to them:
+the hash move, captures and promotions by MVV-LVA, the killer moves of the ply, then the quiet moves by history score.
+The hash and killer moves are checked with GameState.legalQuietMove, captures come from generateTacticalMoves and
+only a node that gets past all of them calls generateQuietMoves, so after an early cutoff the quiet moves are never
+generated at all.
+"""
+from Chess import ChessEngine
+
+pieceValues = {'K': 0, 'Q': 900, 'R': 500, 'B': 330, 'N': 320, 'p': 100}
+FROM_TO_MASK = (1 << 12) - 1 #start and end square bits of Move.moveID
+KILLERS_PER_PLY = 2
+MAX_PLY = 128
+HISTORY_LIMIT = 1 << 20 #history scores are halved once one reaches this
+
+'''
+Most valuable victim, least valuable attacker, with promotions counted as winning the promoted piece
+'''
+def mvvLva(move):
+    score = 0
+    if move.pieceCaptured != '--':
+        score += 10 * pieceValues[move.pieceCaptured[1]] - pieceValues[move.pieceMoved[1]] + 1000
+    if move.isPawnPromotion:
+        score += pieceValues[move.promotionChoice]
+    return score
+
+def isTactical(move):
+    return move.pieceCaptured != '--' or move.isPawnPromotion
+
+
+class MoveOrderer():
+    def __init__(self):
+        self.killers = [[0] * KILLERS_PER_PLY for ply in range(MAX_PLY)] #moveIDs, 0 is never a legal move
+        self.history = [[0] * (FROM_TO_MASK + 1), [0] * (FROM_TO_MASK + 1)] #[black, white][from | to << 6]
+
+    def clear(self):
+        self.__init__()
+
+    '''
+    Between searches: forget the killers, which belong to positions at each ply, and fade the history
+    '''
+    def newSearch(self):
+        self.killers = [[0] * KILLERS_PER_PLY for ply in range(MAX_PLY)]
+        for table in self.history:
+            for i in range(len(table)):
+                table[i] >>= 1
+
+    '''
+    Yield the legal moves of gs best first, generating each stage only when the previous one is used up; hashMove is
+    a packed move from the transposition table or None. gs must be back in the same position whenever the generator
+    is resumed
+    '''
+    def orderedMoves(self, gs, hashMove, ply):
+        hashID = hashMove & ChessEngine.Move.ID_MASK if hashMove is not None else -1
+        tried = [] #moveIDs of the quiet moves already yielded
+        if hashID >= 0:
+            move = gs.legalQuietMove(hashID)
+            if move is not None:
+                tried.append(hashID)
+                yield move
+
+        captures = gs.generateTacticalMoves()
+        if hashID >= 0 and not tried:
+            for i in range(len(captures)):
+                if captures[i].moveID == hashID:
+                    tried.append(hashID)
+                    yield captures.pop(i)
+                    break
+        captures.sort(key=mvvLva, reverse=True)
+        for move in captures:
+            yield move
+
+        killers = self.killers[ply] if ply < MAX_PLY else ()
+        for killer in killers:
+            if killer != 0 and killer not in tried:
+                move = gs.legalQuietMove(killer)
+                if move is not None:
+                    tried.append(killer)
+                    yield move
+
+        quiets = gs.generateQuietMoves()
+        if tried:
+            quiets = [move for move in quiets if move.moveID not in tried]
+        history = self.history[gs.whiteToMove]
+        quiets.sort(key=lambda move: history[move.moveID & FROM_TO_MASK], reverse=True)
+        if hashID >= 0 and hashID not in tried: #a castling hash move, which legalQuietMove does not recognise
+            for i in range(len(quiets)):
+                if quiets[i].moveID == hashID:
+                    quiets.insert(0, quiets.pop(i))
+                    break
+        for move in quiets:
+            yield move
+
+    '''
+    A quiet move caused a beta cutoff: make it a killer at this ply and reward it in the history table,
+    more for cutoffs found deeper in the tree
+    '''
+    def recordCutoff(self, move, ply, depth, whiteToMove):
+        if isTactical(move):
+            return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move.moveID:
+                killers[1:] = killers[:-1]
+                killers[0] = move.moveID
+        history = self.history[whiteToMove]
+        index = move.moveID & FROM_TO_MASK
+        history[index] += depth * depth
+        if history[index] >= HISTORY_LIMIT:
+            for table in self.history:
+                for i in range(len(table)):
+                    table[i] >>= 1
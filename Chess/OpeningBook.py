@@ -0,0 +1,158 @@
+"""
+Opening book stored as a sorted array of fixed width binary entries, read through mmap.
+Each entry is (Zobrist position key, packed move, weight), sorted by key, so a lookup is a binary search over the
+mapped file with no parsing and no per process copy; every engine process shares the file through the page cache.
+Build a book from PGN archives with: python -m Chess.OpeningBook book.bin games.pgn [more.pgn ...]
+Probe it with: python -m Chess.OpeningBook book.bin --probe FEN
+"""
+import argparse
+import mmap
+import random
+import struct
+import time
+
+from Chess import ChessEngine, PGN, Search
+
+MAGIC = b'CPBK'
+VERSION = 1
+HEADER = struct.Struct('>4sII') #magic, version, entry count
+ENTRY = struct.Struct('>QHH') #position key, packed move, weight
+MAX_WEIGHT = 0xFFFF
+DEFAULT_PLIES = 20 #only the first moves of each game go into the book
+
+
+class OpeningBook():
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("not an opening book: " + path)
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+    def keyAt(self, index):
+        return struct.unpack_from('>Q', self.data, HEADER.size + index * ENTRY.size)[0]
+
+    '''
+    (packed move, weight) for every book entry of the position key, heaviest first
+    '''
+    def lookup(self, key):
+        low = 0
+        high = self.count
+        while low < high: #first entry with a key >= key
+            middle = (low + high) // 2
+            if self.keyAt(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        offset = HEADER.size + low * ENTRY.size
+        for index in range(low, self.count):
+            entryKey, packed, weight = ENTRY.unpack_from(self.data, offset)
+            if entryKey != key:
+                break
+            entries.append((packed, weight))
+            offset += ENTRY.size
+        return entries
+
+    '''
+    Book moves of the position as (Move, weight), checked against the legal moves
+    '''
+    def getMoves(self, gs):
+        entries = self.lookup(gs.zobristKey)
+        if not entries:
+            return []
+        legalMoves = gs.getValidMoves()
+        moves = []
+        for packed, weight in entries:
+            move = Search.findMove(legalMoves, packed)
+            if move is not None:
+                moves.append((move, weight))
+        return moves
+
+    '''
+    A book move picked at random in proportion to its weight, or None when the position is out of book
+    '''
+    def pickMove(self, gs, rng=random):
+        moves = self.getMoves(gs)
+        if not moves:
+            return None
+        return rng.choices([move for move, weight in moves], [weight for move, weight in moves])[0]
+
+'''
+Count how often each move was played in each position over the first plies of every game
+Returns {(position key, packed move): count}
+'''
+def collectMoves(pgnPaths, plies=DEFAULT_PLIES, report=print):
+    counts = {}
+    games = 0
+    for path in pgnPaths:
+        with open(path) as f:
+            for game in PGN.readGames(f):
+                if "FEN" in game.headers: #only games from the standard start position
+                    continue
+                gs = ChessEngine.GameState()
+                try:
+                    for san in game.moves[:plies]:
+                        move = PGN.sanToMove(gs, san)
+                        entry = (gs.zobristKey, move.pack())
+                        counts[entry] = counts.get(entry, 0) + 1
+                        gs.makeMove(move)
+                except ValueError as error:
+                    if report is not None:
+                        report("game %d: %s" % (games + 1, error))
+                games += 1
+    return counts
+
+'''
+Write the counted moves as a book file: the header, then the entries sorted by key and heaviest move first
+Weights are scaled down to fit 16 bits if needed, keeping every entry at least 1
+'''
+def writeBook(counts, path):
+    heaviest = max(counts.values()) if counts else 1
+    scale = MAX_WEIGHT / heaviest if heaviest > MAX_WEIGHT else 1
+    entries = sorted(((key, packed, max(1, int(count * scale))) for (key, packed), count in counts.items()),
+                     key=lambda entry: (entry[0], -entry[2], entry[1]))
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        for entry in entries:
+            f.write(ENTRY.pack(*entry))
+    return len(entries)
+
+def buildBook(pgnPaths, path, plies=DEFAULT_PLIES, report=print):
+    start = time.perf_counter()
+    count = writeBook(collectMoves(pgnPaths, plies, report), path)
+    if report is not None:
+        report("%d book entries written to %s in %.2fs" % (count, path, time.perf_counter() - start))
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="build or probe an opening book")
+    parser.add_argument("book")
+    parser.add_argument("pgn", nargs="*", help="PGN archives to build the book from")
+    parser.add_argument("--plies", type=int, default=DEFAULT_PLIES, help="plies of each game to put in the book")
+    parser.add_argument("--probe", metavar="FEN", help="list the book moves of this position instead of building")
+    args = parser.parse_args()
+
+    if args.probe is None:
+        buildBook(args.pgn, args.book, args.plies)
+        return
+    book = OpeningBook(args.book)
+    gs = ChessEngine.GameState(args.probe)
+    start = time.perf_counter()
+    moves = book.getMoves(gs)
+    seconds = time.perf_counter() - start
+    for move, weight in moves:
+        print(PGN.moveToSan(gs, move), weight)
+    print("%d book moves in %.1f microseconds" % (len(moves), seconds * 1e6))
+    book.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Streaming PGN reader and writer.
+readGames parses one game at a time from a file of any size, SAN moves are resolved against
+GameState.getValidMoves, and writeGame turns a moveLog back into SAN.
+Run from the project root with: python -m Chess.PGN games.pgn
+"""
+import argparse
+import re
+import time
+
+from Chess import ChessEngine
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+TAG_PATTERN = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+# piece, from file, from rank, capture, destination, promotion
+SAN_PATTERN = re.compile(r'^([KQRBN])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([QRBN]))?$')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d+\.+')
+
+
+class PGNGame():
+    def __init__(self, headers, moves, result):
+        self.headers = headers #tag pairs in file order
+        self.moves = moves #SAN strings, comments and variations stripped
+        self.result = result
+
+    '''
+    Replay the game into a new GameState, starting from the FEN tag if there is one
+    '''
+    def replay(self, backend='mailbox'):
+        gs = ChessEngine.newGameState(backend, self.headers.get("FEN"))
+        for san in self.moves:
+            gs.makeMove(sanToMove(gs, san))
+        return gs
+
+'''
+Yield PGNGame objects one at a time from an open text file, reading it line by line
+so memory stays flat however large the archive is
+'''
+def readGames(f):
+    headers = {}
+    moves = []
+    result = None
+    commentDepth = 0 #inside {...}
+    variationDepth = 0 #inside (...)
+    inMoves = False
+    for line in f:
+        line = line.strip()
+        if commentDepth == 0 and variationDepth == 0:
+            if line.startswith('%'): #escaped line
+                continue
+            if line.startswith('['):
+                if inMoves: #a tag after movetext without a result token starts the next game
+                    yield PGNGame(headers, moves, result or '*')
+                    headers, moves, result, inMoves = {}, [], None, False
+                match = TAG_PATTERN.match(line)
+                if match:
+                    headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+                continue
+        if line.startswith(';'):
+            continue
+        for token in tokenize(line):
+            if commentDepth:
+                if token == '}':
+                    commentDepth = 0
+                continue
+            if token == '{':
+                commentDepth = 1
+            elif token == ';': #rest of line is a comment
+                break
+            elif token == '(':
+                variationDepth += 1
+            elif token == ')':
+                variationDepth -= 1
+            elif variationDepth:
+                continue
+            elif token in RESULTS:
+                result = token
+                yield PGNGame(headers, moves, result)
+                headers, moves, result, inMoves = {}, [], None, False
+            elif token.startswith('$'): #numeric annotation glyph
+                continue
+            else:
+                token = MOVE_NUMBER_PATTERN.sub('', token)
+                if token:
+                    moves.append(token)
+                    inMoves = True
+    if inMoves or headers:
+        yield PGNGame(headers, moves, result or '*')
+
+'''
+Split a movetext line into tokens, keeping braces and parentheses as tokens of their own
+'''
+def tokenize(line):
+    for char in '{}();':
+        line = line.replace(char, ' ' + char + ' ')
+    return line.split()
+
+'''
+Find the legal move in the current position that the SAN string describes
+'''
+def sanToMove(gs, san):
+    clean = san.rstrip('+#!?')
+    moves = gs.getValidMoves()
+    if clean in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        kingside = len(clean) == 3
+        for move in moves:
+            if move.isCastleMove and (move.endCol > move.startCol) == kingside:
+                return move
+        raise ValueError("illegal castling in this position: " + san)
+    match = SAN_PATTERN.match(clean)
+    if match is None:
+        raise ValueError("not a SAN move: " + san)
+    piece, fromFile, fromRank, capture, destination, promotion = match.groups()
+    piece = piece or 'p'
+    endRow = ChessEngine.Move.ranksToRows[destination[1]]
+    endCol = ChessEngine.Move.filesToCols[destination[0]]
+    found = None
+    for move in moves:
+        if move.endRow != endRow or move.endCol != endCol or move.pieceMoved[1] != piece or move.isCastleMove:
+            continue
+        if fromFile is not None and move.startCol != ChessEngine.Move.filesToCols[fromFile]:
+            continue
+        if fromRank is not None and move.startRow != ChessEngine.Move.ranksToRows[fromRank]:
+            continue
+        if move.isPawnPromotion and move.promotionChoice != (promotion or 'Q'):
+            continue
+        if found is not None:
+            raise ValueError("ambiguous SAN move: " + san)
+        found = move
+    if found is None:
+        raise ValueError("illegal SAN move in this position: " + san)
+    return found
+
+'''
+SAN for a move that is legal in the current position (the move is made and undone to add the check suffix)
+'''
+def moveToSan(gs, move, legalMoves=None):
+    if move.isCastleMove:
+        san = 'O-O' if move.endCol > move.startCol else 'O-O-O'
+    else:
+        piece = move.pieceMoved[1]
+        destination = move.getRankFile(move.endRow, move.endCol)
+        isCapture = move.pieceCaptured != '--'
+        if piece == 'p':
+            san = (move.colsToFiles[move.startCol] + 'x' if isCapture else '') + destination
+            if move.isPawnPromotion:
+                san += '=' + move.promotionChoice
+        else:
+            if legalMoves is None:
+                legalMoves = gs.getValidMoves()
+            rivals = [other for other in legalMoves if other.pieceMoved == move.pieceMoved and
+                      other.endRow == move.endRow and other.endCol == move.endCol and
+                      (other.startRow, other.startCol) != (move.startRow, move.startCol)]
+            disambiguation = ''
+            if rivals:
+                if all(other.startCol != move.startCol for other in rivals):
+                    disambiguation = move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in rivals):
+                    disambiguation = move.rowsToRanks[move.startRow]
+                else:
+                    disambiguation = move.getRankFile(move.startRow, move.startCol)
+            san = piece + disambiguation + ('x' if isCapture else '') + destination
+    gs.makeMove(move)
+    if gs.inCheck():
+        san += '#' if len(gs.getValidMoves()) == 0 else '+'
+    gs.undoMove()
+    return san
+
+'''
+SAN strings for every move in a move log, replayed from the start position or the given FEN
+'''
+def moveLogToSan(moveLog, fen=None):
+    gs = ChessEngine.GameState(fen)
+    sans = []
+    for move in moveLog:
+        legalMoves = gs.getValidMoves()
+        move = legalMoves[legalMoves.index(move)] #the generated move carries the right flags for this position
+        sans.append(moveToSan(gs, move, legalMoves))
+        gs.makeMove(move)
+    return sans
+
+'''
+Write one game as PGN: tag pairs, then numbered SAN movetext wrapped at 80 columns
+'''
+def writeGame(f, moveLog, headers=None, result='*', fen=None):
+    headers = dict(headers or {})
+    if fen is not None:
+        headers.setdefault("SetUp", "1")
+        headers["FEN"] = fen
+    headers["Result"] = result
+    for tag in ("Event", "Site", "Date", "Round", "White", "Black"): #seven tag roster order first
+        headers.setdefault(tag, "?")
+    roster = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+    for tag in list(roster) + [tag for tag in headers if tag not in roster]:
+        f.write('[%s "%s"]\n' % (tag, headers[tag].replace('\\', '\\\\').replace('"', '\\"')))
+    f.write('\n')
+
+    start = ChessEngine.GameState(fen)
+    moveNumber = start.fullmoveNumber
+    whiteToMove = start.whiteToMove
+    tokens = []
+    for i, san in enumerate(moveLogToSan(moveLog, fen)):
+        if whiteToMove:
+            tokens.append("%d." % moveNumber)
+        elif i == 0:
+            tokens.append("%d..." % moveNumber)
+        tokens.append(san)
+        if not whiteToMove:
+            moveNumber += 1
+        whiteToMove = not whiteToMove
+    tokens.append(result)
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            f.write(line + '\n')
+            line = token
+        else:
+            line = line + ' ' + token if line else token
+    f.write(line + '\n\n')
+
+'''
+Replay every game of a PGN file and report games/sec and plies/sec
+'''
+def replayFile(path, backend='mailbox', report=print):
+    games = 0
+    plies = 0
+    errors = 0
+    start = time.perf_counter()
+    with open(path) as f:
+        for game in readGames(f):
+            try:
+                gs = game.replay(backend)
+                plies += len(gs.moveLog)
+                games += 1
+            except ValueError as error:
+                errors += 1
+                if report is not None:
+                    report("skipped game %d: %s" % (games + errors, error))
+    seconds = time.perf_counter() - start
+    if report is not None and seconds > 0:
+        report("%d games, %d plies in %.2fs: %.1f games/sec, %.0f plies/sec, %d skipped" %
+               (games, plies, seconds, games / seconds, plies / seconds, errors))
+    return games, plies, errors, seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="replay a PGN archive and report throughput")
+    parser.add_argument("path")
+    parser.add_argument("--backend", default="mailbox", help="GameState backend: mailbox or bitboard")
+    args = parser.parse_args()
+    replayFile(args.path, args.backend)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Process pool versions of perft and best move search.
+The root moves of GameState.getValidMoves() are split across worker processes, each with its own GameState,
+and the counts and scores are merged back in the parent. Positions travel as GameState.packPosition() tuples
+rather than pickled GameStates with their move logs.
+Run from the project root with: python -m Chess.Parallel --help
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+from Chess import ChessEngine, Perft, Search
+
+workerBackend = 'mailbox'
+workerSearcher = None
+
+'''
+Runs once in every worker process
+'''
+def initWorker(backend, tableSize):
+    global workerBackend, workerSearcher
+    workerBackend = backend
+    workerSearcher = Search.Searcher(tableSize)
+
+def unpack(packed):
+    gs = ChessEngine.newGameState(workerBackend)
+    gs.loadPackedPosition(packed)
+    return gs
+
+def perftTask(task):
+    packed, depth, bulk = task
+    return Perft.perft(unpack(packed), depth, bulk)
+
+'''
+Search a packed position; returns (scores, packed pv, nodes, depth)
+scores holds the score after every completed depth, so results of different workers compare at the same depth;
+a mate or a position without moves is final and repeats to the requested depth. depth is the depth reached, 0 with
+an empty scores when the budget ran out before depth 1 finished: the pv then only holds a fallback move
+deadline is a time.time() value shared by all tasks of one search, the task stops at it or after timeLimit; a task
+that only starts after the deadline does not search at all and returns no pv
+'''
+def searchTask(task):
+    packed, depth, timeLimit, nodeLimit, deadline = task
+    if deadline is not None:
+        remaining = deadline - time.time()
+        if remaining <= 0: #the search only checks its budget every 1024 nodes, do not start one that is already over
+            return [], [], 0, 0
+        timeLimit = remaining if timeLimit is None else min(timeLimit, remaining)
+    gs = unpack(packed)
+    scores = []
+    result = workerSearcher.search(gs, maxDepth=depth, timeLimit=timeLimit, nodeLimit=nodeLimit,
+                                   onIteration=lambda iteration: scores.append(iteration.score))
+    if result.bestMove is None or abs(result.score) >= Search.MATE_BOUND: #deeper search would not change it
+        scores = [result.score] * depth
+    return scores, [move.pack() for move in result.pv], result.nodes, result.depth
+
+'''
+Build the packed child position for every root move
+'''
+def splitRoot(gs):
+    children = []
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        children.append((move, gs.packPosition()))
+        gs.undoMove()
+    return children
+
+def makePool(workers, backend, tableSize=1 << 16):
+    return multiprocessing.Pool(workers, initializer=initWorker, initargs=(backend, tableSize))
+
+'''
+Perft with one task per root move; returns the total and the per root move counts
+'''
+def parallelPerft(gs, depth, workers=None, bulk=False, backend='mailbox', pool=None):
+    if depth <= 1:
+        return Perft.perft(gs, depth, bulk), {}
+    children = splitRoot(gs)
+    ownPool = pool is None
+    if ownPool:
+        pool = makePool(workers or os.cpu_count(), backend)
+    try:
+        counts = pool.map(perftTask, [(packed, depth - 1, bulk) for move, packed in children], chunksize=1)
+    finally:
+        if ownPool:
+            pool.close()
+            pool.join()
+    return sum(counts), {move.getChessNotation(): count for (move, packed), count in zip(children, counts)}
+
+'''
+Root split search: every root move is searched depth - 1 plies deep in a worker and the best reply score wins
+timeLimit and nodeLimit are for the whole search: every root move gets its share, and no worker runs past the
+deadline. Root moves are compared at the deepest depth every searched one completed, which is the depth reported
+Returns a Search.SearchResult with the node counts of all workers added up
+'''
+def parallelSearch(gs, depth, workers=None, timeLimit=None, nodeLimit=None, backend='mailbox', pool=None):
+    start = time.perf_counter()
+    depth = max(depth, 2) #workers need at least one ply of their own
+    children = splitRoot(gs)
+    if len(children) == 0:
+        return Search.Searcher().search(gs, maxDepth=1)
+    workers = workers or os.cpu_count()
+    running = min(workers, os.cpu_count() or 1) #children searched at the same time
+    deadline = time.time() + timeLimit if timeLimit is not None else None
+    childTime = min(timeLimit, timeLimit * running / len(children)) if timeLimit is not None else None
+    childNodes = max(1, nodeLimit // len(children)) if nodeLimit is not None else None
+    ownPool = pool is None
+    if ownPool:
+        pool = makePool(workers, backend)
+    try:
+        tasks = [(packed, depth - 1, childTime, childNodes, deadline) for move, packed in children]
+        replies = pool.map(searchTask, tasks, chunksize=1)
+    finally:
+        if ownPool:
+            pool.close()
+            pool.join()
+
+    nodes = sum(reply[2] for reply in replies)
+    searched = [i for i in range(len(replies)) if replies[i][0]] #the others ran out of budget before depth 1
+    if not searched: #no child finished, like Search.search stopped before depth 1
+        bestMove = children[0][0]
+        return Search.SearchResult(bestMove, 0, 0, [bestMove], nodes, time.perf_counter() - start)
+    commonDepth = min(len(replies[i][0]) for i in searched)
+    bestScore = -Search.CHECKMATE - 1
+    bestIndex = None
+    for i in searched:
+        score = -replies[i][0][commonDepth - 1]
+        if score >= Search.MATE_BOUND: #one ply further from the root than the worker saw it
+            score -= 1
+        elif score <= -Search.MATE_BOUND:
+            score += 1
+        if score > bestScore:
+            bestScore = score
+            bestIndex = i
+
+    bestMove = children[bestIndex][0]
+    pv = [bestMove]
+    gs.makeMove(bestMove)
+    for packed in replies[bestIndex][1]:
+        move = Search.findMove(gs.getValidMoves(), packed)
+        if move is None:
+            break
+        pv.append(move)
+        gs.makeMove(move)
+    for i in range(len(pv)):
+        gs.undoMove()
+    return Search.SearchResult(bestMove, bestScore, commonDepth + 1, pv, nodes, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="multiprocess perft and root split search")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fen", default="rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+    parser.add_argument("--backend", default="mailbox", help="GameState backend: mailbox or bitboard")
+    parser.add_argument("--search", action="store_true", help="search for the best move instead of running perft")
+    args = parser.parse_args()
+
+    gs = ChessEngine.newGameState(args.backend, args.fen)
+    start = time.perf_counter()
+    if args.search:
+        result = parallelSearch(gs, args.depth, args.workers, backend=args.backend)
+        print(result)
+    else:
+        nodes, counts = parallelPerft(gs, args.depth, args.workers, backend=args.backend)
+        seconds = time.perf_counter() - start
+        print("perft %d: %d nodes in %.2fs, %d nodes/sec with %d workers" % (args.depth, nodes, seconds,
+                                                                            nodes / seconds, args.workers))
+
+
+if __name__ == '__main__':
+    main()
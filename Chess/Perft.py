@@ -0,0 +1,124 @@
+"""
+Perft: counts the leaf nodes of the legal move tree to a fixed depth and compares them with published counts,
+so move generation can be checked for correctness and timed at the same time.
+Run from the project root with: python -m Chess.Perft --help
+"""
+import argparse
+import json
+import time
+
+from Chess import ChessEngine
+
+# standard reference positions with their known node counts at depth 1, 2, 3, ...
+REFERENCE_POSITIONS = [
+    ("startpos", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+'''
+Count the leaf nodes depth plies below the current position
+With bulk counting the last ply is counted from the length of the move list instead of making each move
+'''
+def perft(gs, depth, bulk=False):
+    if depth == 0:
+        return 1
+    moves = gs.getValidMoves()
+    if bulk and depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1, bulk)
+        gs.undoMove()
+    return nodes
+
+'''
+Perft split by root move, the usual way to find which move a generator gets wrong
+'''
+def divide(gs, depth, bulk=False):
+    counts = {}
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        notation = move.getChessNotation()
+        if move.isPawnPromotion:
+            notation += move.promotionChoice.lower()
+        counts[notation] = perft(gs, depth - 1, bulk)
+        gs.undoMove()
+    return counts
+
+'''
+Run perft on every reference position up to maxDepth, timing each depth
+Returns one record per (position, depth) with the expected and actual counts and nodes/sec
+'''
+def runSuite(maxDepth=3, bulk=False, backend='mailbox', report=print):
+    results = []
+    for name, fen, expected in REFERENCE_POSITIONS:
+        for depth in range(1, min(maxDepth, len(expected)) + 1):
+            gs = ChessEngine.newGameState(backend, fen)
+            start = time.perf_counter()
+            nodes = perft(gs, depth, bulk)
+            seconds = time.perf_counter() - start
+            record = {"position": name, "depth": depth, "nodes": nodes, "expected": expected[depth - 1],
+                      "ok": nodes == expected[depth - 1], "seconds": round(seconds, 4),
+                      "nps": int(nodes / seconds) if seconds > 0 else 0}
+            results.append(record)
+            if report is not None:
+                report("%-10s depth %d %10d nodes %10d nps %s" % (name, depth, nodes, record["nps"],
+                                                                  "ok" if record["ok"] else "FAIL expected %d" % expected[depth - 1]))
+    return results
+
+'''
+Compare a run against a stored baseline: every count must still match and the nodes/sec ratio shows the speed change
+'''
+def compareWithBaseline(results, baseline, report=print):
+    previous = {(record["position"], record["depth"]): record for record in baseline["results"]}
+    allOk = True
+    for record in results:
+        allOk = allOk and record["ok"]
+        old = previous.get((record["position"], record["depth"]))
+        if old is not None and old["nps"] > 0:
+            report("%-10s depth %d %6.2fx nodes/sec" % (record["position"], record["depth"], record["nps"] / old["nps"]))
+    return allOk
+
+def main():
+    parser = argparse.ArgumentParser(description="perft correctness and speed suite")
+    parser.add_argument("--depth", type=int, default=3, help="deepest depth to run for each reference position")
+    parser.add_argument("--bulk", action="store_true", help="count the last ply from the move list length")
+    parser.add_argument("--backend", default="mailbox", help="GameState backend: mailbox or bitboard")
+    parser.add_argument("--divide", metavar="FEN", help="print per root move counts for this position instead")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="PATH", help="compare the results with a JSON baseline")
+    args = parser.parse_args()
+
+    if args.divide:
+        counts = divide(ChessEngine.newGameState(args.backend, args.divide), args.depth, args.bulk)
+        for notation in sorted(counts):
+            print(notation, counts[notation])
+        print("total", sum(counts.values()))
+        return
+
+    results = runSuite(args.depth, args.bulk, args.backend)
+    ok = all(record["ok"] for record in results)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"backend": args.backend, "bulk": args.bulk, "results": results}, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            ok = compareWithBaseline(results, json.load(f)) and ok
+    print("all counts match" if ok else "MISMATCH")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+Optional instrumentation of the engine's hot paths: call counts, time and Move allocations, collected per call tree.
+Nothing is instrumented until a Profiler is entered: entering wraps the hot path methods on the GameState classes
+and leaving puts the original functions back, so the engine runs the exact same code as before when profiling is off.
+    with Profiler() as profiler:
+        gs.getValidMoves()
+    profiler.dump("profile.json")
+Profile a search from the project root with: python -m Chess.Profiler [--depth N] [--fen FEN] [--out profile.json]
+"""
+import argparse
+import json
+import threading
+import time
+
+from Chess import ChessEngine, Search
+
+HOT_PATHS = ('getValidMoves', 'generateValidMoves', 'generateLegalMoves', 'generateTacticalMoves', 'generateQuietMoves',
+             'legalQuietMove', 'getAllPossibleMoves', 'getPawnMoves', 'getRookMoves', 'getKnightMoves',
+             'getBishopMoves', 'getQueenMoves', 'getKingMoves', 'getPieceCaptures', 'getPieceQuiets',
+             'getLegalKingMoves', 'getCastleMoves', 'checkForPinsAndChecks', 'squareUnderAttack', 'isAttackedBy',
+             'makeMove', 'undoMove')
+
+
+'''
+One node of a call tree: the calls of a method made from one chain of callers
+'''
+class CallNode():
+    __slots__ = ('name', 'calls', 'ns', 'childNs', 'movesCreated', 'children')
+
+    def __init__(self, name=None):
+        self.name = name
+        self.calls = 0
+        self.ns = 0
+        self.childNs = 0 #time spent in instrumented callees
+        self.movesCreated = 0 #Move objects made directly inside this node
+        self.children = {}
+
+    def child(self, name):
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = CallNode(name)
+        return node
+
+    def toDict(self):
+        return {"calls": self.calls, "ms": self.ns / 1e6, "selfMs": (self.ns - self.childNs) / 1e6,
+                "movesCreated": self.movesCreated,
+                "children": {name: node.toDict() for name, node in self.children.items()}}
+
+
+class Profiler():
+    active = None #only one Profiler patches the classes at a time
+
+    def __init__(self):
+        self.local = threading.local()
+        self.roots = {} #call tree of every thread that ran instrumented code, by thread name
+        self.rootsLock = threading.Lock()
+        self.totals = {} #method name -> [calls, ns] over every tree
+        self.originals = []
+        self.start = None
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.disable()
+        return False
+
+    '''
+    Wrap the hot paths; the methods stay wrapped, for every GameState, until disable
+    '''
+    def enable(self):
+        if Profiler.active is not None:
+            raise RuntimeError("another Profiler is already active")
+        Profiler.active = self
+        for cls in gameStateClasses():
+            for name in HOT_PATHS:
+                if name in cls.__dict__:
+                    self.patch(cls, name, self.wrap(name, cls.__dict__[name]))
+        self.patch(ChessEngine.Move, '__init__', self.wrapMoveInit(ChessEngine.Move.__init__))
+        ChessEngine.GameState.bindMoveFunctions() #the piece generator table picks up the wrapped generators
+        self.start = time.perf_counter()
+        return self
+
+    '''
+    Put the original methods back, the collected counts stay readable
+    '''
+    def disable(self):
+        if Profiler.active is not self:
+            return
+        self.elapsed += time.perf_counter() - self.start
+        for cls, name, original in reversed(self.originals):
+            setattr(cls, name, original)
+        self.originals = []
+        ChessEngine.GameState.bindMoveFunctions()
+        Profiler.active = None
+
+    def patch(self, cls, name, replacement):
+        self.originals.append((cls, name, cls.__dict__[name]))
+        setattr(cls, name, replacement)
+
+    '''
+    The call stack of the current thread, starting at the thread's root node
+    '''
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            root = CallNode()
+            with self.rootsLock:
+                self.roots[threading.current_thread().name] = root
+            stack = self.local.stack = [root]
+        return stack
+
+    def wrap(self, name, func):
+        totals = self.totals.setdefault(name, [0, 0])
+        def wrapped(*args, **kwargs):
+            stack = self.stack()
+            parent = stack[-1]
+            node = parent.child(name)
+            stack.append(node)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter_ns() - start
+                stack.pop()
+                node.calls += 1
+                node.ns += elapsed
+                parent.childNs += elapsed
+                if parent.name != name: #a subclass calling the wrapped super() method is one call
+                    totals[0] += 1
+                    totals[1] += elapsed
+        wrapped.__name__ = func.__name__
+        wrapped.__doc__ = func.__doc__
+        return wrapped
+
+    def wrapMoveInit(self, init):
+        def wrapped(move, *args, **kwargs):
+            self.stack()[-1].movesCreated += 1
+            init(move, *args, **kwargs)
+        return wrapped
+
+    '''
+    (calls, total ms) of a method over every call tree
+    '''
+    def total(self, name):
+        calls, ns = self.totals.get(name, (0, 0))
+        return calls, ns / 1e6
+
+    '''
+    Average ms per call of a method, 0 before it was called
+    '''
+    def averageMs(self, name):
+        calls, ms = self.total(name)
+        return ms / calls if calls else 0.0
+
+    def report(self):
+        elapsed = self.elapsed + (time.perf_counter() - self.start if Profiler.active is self else 0.0)
+        with self.rootsLock:
+            roots = dict(self.roots)
+        movesCreated = sum(countMoves(root) for root in roots.values())
+        makeMoves = self.total('makeMove')[0]
+        return {"wallMs": elapsed * 1000,
+                "movesCreated": movesCreated,
+                "movesCreatedPerMakeMove": movesCreated / makeMoves if makeMoves else None,
+                "totals": {name: {"calls": calls, "ms": ns / 1e6} for name, (calls, ns) in self.totals.items()
+                           if calls},
+                "threads": {name: root.toDict()["children"] for name, root in roots.items()}}
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+'''
+The GameState classes to instrument: the mailbox one and, when it is importable, the bitboard one
+'''
+def gameStateClasses():
+    classes = [ChessEngine.GameState]
+    try:
+        from Chess.BitboardEngine import BitboardGameState
+        classes.append(BitboardGameState)
+    except ImportError:
+        pass
+    return classes
+
+def countMoves(node):
+    return node.movesCreated + sum(countMoves(child) for child in node.children.values())
+
+def main():
+    parser = argparse.ArgumentParser(description="profile the engine's hot paths during a fixed depth search")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fen", help="position to search, the start position by default")
+    parser.add_argument("--backend", default="mailbox", help="GameState backend: mailbox or bitboard")
+    parser.add_argument("--out", default="profile.json", help="where to write the JSON report")
+    args = parser.parse_args()
+
+    gs = ChessEngine.newGameState(args.backend, args.fen)
+    searcher = Search.Searcher()
+    start = time.perf_counter()
+    searcher.search(gs, args.depth)
+    plain = time.perf_counter() - start
+
+    searcher = Search.Searcher()
+    with Profiler() as profiler:
+        searcher.search(gs, args.depth)
+    profiler.dump(args.out)
+    report = profiler.report()
+    print("search without profiling %.0f ms, with profiling %.0f ms" % (plain * 1000, report["wallMs"]))
+    for name, total in sorted(report["totals"].items(), key=lambda item: -item[1]["ms"]):
+        print("%-22s %9d calls %10.1f ms" % (name, total["calls"], total["ms"]))
+    print("%d Move objects created, %.1f per makeMove" % (report["movesCreated"], report["movesCreatedPerMakeMove"] or 0))
+    print("report written to " + args.out)
+
+
+if __name__ == '__main__':
+    main()
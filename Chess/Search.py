@@ -0,0 +1,295 @@
+"""
+Computer player built on GameState: negamax alpha-beta with iterative deepening, quiescence search on captures
+and a bounded transposition table keyed by the Zobrist position key.
+"""
+import time
+
+from Chess import ChessEngine, Evaluation, MoveOrdering
+
+CHECKMATE = 100000
+MATE_BOUND = CHECKMATE - 1000 #scores beyond this are mates, stored in the table relative to the node
+DRAW = 0
+
+EXACT = 0
+LOWER = 1 #score is at least this much (beta cutoff)
+UPPER = 2 #score is at most this much (failed low)
+
+
+class SearchStopped(Exception):
+    pass
+
+
+'''
+Fixed number of buckets, each with a depth preferred slot and an always replace slot
+Entries are tuples (key, depth, score, flag, packed best move, generation)
+'''
+class TranspositionTable():
+    def __init__(self, size=1 << 18):
+        self.size = size
+        self.deepSlots = [None] * size
+        self.recentSlots = [None] * size
+        self.generation = 0
+
+    '''
+    Start a new search so entries from older searches lose their claim on the depth preferred slot
+    '''
+    def newSearch(self):
+        self.generation += 1
+
+    def clear(self):
+        self.deepSlots = [None] * self.size
+        self.recentSlots = [None] * self.size
+
+    def probe(self, key):
+        index = key % self.size
+        entry = self.deepSlots[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = self.recentSlots[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, bestMove):
+        index = key % self.size
+        entry = (key, depth, score, flag, bestMove, self.generation)
+        deep = self.deepSlots[index]
+        if deep is None or deep[0] == key or depth >= deep[1] or deep[5] != self.generation:
+            self.deepSlots[index] = entry
+        else:
+            self.recentSlots[index] = entry
+
+
+class SearchResult():
+    def __init__(self, bestMove, score, depth, pv, nodes, elapsed):
+        self.bestMove = bestMove
+        self.score = score
+        self.depth = depth
+        self.pv = pv #principal variation, starting with bestMove
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.nps = int(nodes / elapsed) if elapsed > 0 else 0
+
+    def __repr__(self):
+        return "depth %d score %d nodes %d nps %d pv %s" % (self.depth, self.score, self.nodes, self.nps,
+                                                           " ".join(move.getChessNotation() for move in self.pv))
+
+'''
+Tapered material and piece-square score from the point of view of the side to move, kept up to date by GameState
+'''
+def evaluate(gs):
+    return Evaluation.evaluate(gs)
+
+
+class Searcher():
+    def __init__(self, tableSize=1 << 18, useHeuristics=True, tablebases=None):
+        self.table = TranspositionTable(tableSize)
+        self.tablebases = tablebases #Tablebase.Tablebases probed for exact scores in small endings, or None
+        self.ordering = MoveOrdering.MoveOrderer()
+        self.useHeuristics = useHeuristics #killer and history ordering, off to measure what they save
+        self.nodes = 0
+        self.deadline = None
+        self.nodeLimit = None
+        self.stopRequested = False
+
+    '''
+    Ask a running search to return its last completed iteration as soon as possible
+    '''
+    def stop(self):
+        self.stopRequested = True
+
+    '''
+    Iteratively deepen up to maxDepth, within an optional time (seconds) and node budget
+    Returns the SearchResult of the deepest completed iteration, and calls onIteration with each one if given
+    '''
+    def search(self, gs, maxDepth=64, timeLimit=None, nodeLimit=None, onIteration=None):
+        start = time.perf_counter()
+        self.nodes = 0
+        self.deadline = start + timeLimit if timeLimit is not None else None
+        self.nodeLimit = nodeLimit
+        self.stopRequested = False
+        self.table.newSearch()
+        self.ordering.newSearch()
+        checkmate, stalemate = gs.checkmate, gs.stalemate #searching overwrites the flags ChessMain reads
+
+        result = None
+        rootMoves = gs.getValidMoves()
+        if len(rootMoves) == 0:
+            gs.checkmate, gs.stalemate = checkmate, stalemate
+            return SearchResult(None, -CHECKMATE if gs.inCheck() else DRAW, 0, [], 0, time.perf_counter() - start)
+        try:
+            for depth in range(1, maxDepth + 1):
+                score = self.negamax(gs, depth, -CHECKMATE - 1, CHECKMATE + 1, 0)
+                pv = self.principalVariation(gs, depth)
+                result = SearchResult(pv[0] if pv else rootMoves[0], score, depth, pv or [rootMoves[0]], self.nodes,
+                                      time.perf_counter() - start)
+                if onIteration is not None:
+                    onIteration(result)
+                if abs(score) >= MATE_BOUND: #forced mate found, deeper search cannot improve it
+                    break
+        except SearchStopped:
+            pass
+        gs.checkmate, gs.stalemate = checkmate, stalemate
+        if result is None: #stopped before depth 1 finished
+            result = SearchResult(rootMoves[0], 0, 0, [rootMoves[0]], self.nodes, time.perf_counter() - start)
+        return result
+
+    '''
+    Raise SearchStopped once the time or node budget is spent or stop() was called
+    '''
+    def checkBudget(self):
+        if self.stopRequested or (self.nodeLimit is not None and self.nodes >= self.nodeLimit) or \
+                (self.deadline is not None and time.perf_counter() >= self.deadline):
+            raise SearchStopped()
+
+    def negamax(self, gs, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.checkBudget()
+        if ply > 0 and gs.isThreefoldRepetition():
+            return DRAW
+        if ply > 0 and self.tablebases is not None:
+            score = self.tablebases.score(gs, ply)
+            if score is not None:
+                return score
+        if depth <= 0:
+            return self.quiescence(gs, alpha, beta, ply)
+
+        key = gs.zobristKey
+        entry = self.table.probe(key)
+        hashMove = None
+        if entry is not None:
+            hashMove = entry[4]
+            if ply > 0 and entry[1] >= depth:
+                score = scoreFromTable(entry[2], ply)
+                if entry[3] == EXACT or (entry[3] == LOWER and score >= beta) or (entry[3] == UPPER and score <= alpha):
+                    return score
+
+        #the transposition table already covers repeated positions, so moves are generated directly, not from moveCache
+        if self.useHeuristics:
+            ordered = self.ordering.orderedMoves(gs, hashMove, ply) #generated stage by stage, see MoveOrdering
+        else:
+            ordered = gs.generateValidMoves()
+            orderMoves(ordered, hashMove)
+
+        originalAlpha = alpha
+        bestScore = -CHECKMATE - 1
+        bestMove = None
+        for move in ordered:
+            gs.makeMove(move)
+            score = -self.negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+            gs.undoMove()
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if self.useHeuristics:
+                            self.ordering.recordCutoff(move, ply, depth, gs.whiteToMove)
+                        break
+
+        if bestMove is None: #no legal moves
+            return -CHECKMATE + ply if gs.inCheck() else DRAW
+        if bestScore >= beta:
+            flag = LOWER
+        elif bestScore <= originalAlpha:
+            flag = UPPER
+        else:
+            flag = EXACT
+        self.table.store(key, depth, scoreToTable(bestScore, ply), flag, bestMove.pack())
+        return bestScore
+
+    '''
+    Search captures only until the position is quiet, so the static evaluation is never taken mid exchange
+    When in check every evasion is searched, since standing pat is not an option. Otherwise only the tactical moves
+    are generated, so a stalemate is not seen here, only in negamax
+    '''
+    def quiescence(self, gs, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.checkBudget()
+        inCheck = gs.inCheck()
+        if inCheck:
+            moves = gs.generateValidMoves()
+            if len(moves) == 0:
+                return -CHECKMATE + ply
+        else:
+            standPat = evaluate(gs)
+            if standPat >= beta:
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+            moves = gs.generateTacticalMoves()
+        orderMoves(moves, None)
+        bestScore = alpha if not inCheck else -CHECKMATE - 1
+        for move in moves:
+            gs.makeMove(move)
+            score = -self.quiescence(gs, -beta, -alpha, ply + 1)
+            gs.undoMove()
+            if score > bestScore:
+                bestScore = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return bestScore
+
+    '''
+    Follow best moves stored in the transposition table from the root, checking each is legal
+    '''
+    def principalVariation(self, gs, depth):
+        pv = []
+        seen = set()
+        while len(pv) < depth:
+            entry = self.table.probe(gs.zobristKey)
+            if entry is None or gs.zobristKey in seen:
+                break
+            seen.add(gs.zobristKey)
+            move = findMove(gs.getValidMoves(), entry[4])
+            if move is None:
+                break
+            pv.append(move)
+            gs.makeMove(move)
+        for i in range(len(pv)):
+            gs.undoMove()
+        return pv
+
+'''
+Put the hash move first and captures of bigger pieces ahead of quiet moves
+'''
+def orderMoves(moves, hashMove):
+    def score(move):
+        if hashMove is not None and move.moveID == hashMove & ChessEngine.Move.ID_MASK:
+            return 100000
+        return MoveOrdering.mvvLva(move)
+    moves.sort(key=score, reverse=True)
+
+def findMove(moves, packed):
+    moveID = packed & ChessEngine.Move.ID_MASK
+    for move in moves:
+        if move.moveID == moveID:
+            return move
+    return None
+
+'''
+Mate scores are stored relative to the node so they stay correct when the position is reached at another ply
+'''
+def scoreToTable(score, ply):
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+def scoreFromTable(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+if __name__ == '__main__':
+    searcher = Searcher()
+    print(searcher.search(ChessEngine.GameState(), timeLimit=5, onIteration=print))
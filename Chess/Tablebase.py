@@ -0,0 +1,504 @@
+"""
+Endgame tablebases for small pawnless endings (KQvK, KRvK, KQvKR, ...), built by retrograde analysis.
+A table holds one byte per (piece squares, side to move): win or loss for the side to move with the distance to mate
+in plies, draw, or an illegal placement. Tables are named by material with the stronger side as white, and a
+position with the colours the other way round is probed through its mirror image.
+
+Generation: every placement is first scanned with GameState.getValidMoves to find mates, stalemates, the number of
+quiet moves and the best capture into a smaller table. That scan is split into chunks over a process pool, each chunk
+written to disk as it finishes, so an interrupted build picks up where it stopped. Retrograde passes then walk
+backwards from the mates with unmove generation, one ply at a time, so every distance is the shortest mate.
+Build with: python -m Chess.Tablebase tables/ [--tables KQvK KRvKR ...] [--workers N]
+Probe with: python -m Chess.Tablebase tables/ --probe FEN
+"""
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+
+from Chess import ChessEngine, Search
+
+MAGIC = b'CPTB'
+VERSION = 1
+HEADER = struct.Struct('>4sII') #magic, version, entry count
+
+# entry values: 0 draw, 1..126 win in that many plies, 128 + n loss in n plies (128 is checkmated), 255 illegal
+DRAW = 0
+LOSS = 128
+INVALID = 255
+UNKNOWN = 127 #only while generating
+NO_CAPTURE = 255
+
+WIN_RESULT = 1
+DRAW_RESULT = 0
+LOSS_RESULT = -1
+
+DEFAULT_TABLES = ('KQvK', 'KRvK', 'KBvK', 'KNvK')
+CHUNK_SIZE = 1 << 16
+PIECE_ORDER = 'QRBN' #non king pieces, strongest first
+PIECE_STRENGTH = {'Q': 9, 'R': 5, 'B': 3, 'N': 3}
+
+'''
+Squares each piece type can reach from every square, as rays of square indices (row * 8 + col)
+Knights and kings get one single square ray per step, sliders one ray per direction
+'''
+def buildRays():
+    directions = ChessEngine.GameState.directions
+    steps = {'K': (directions, False), 'N': (ChessEngine.GameState.knightJumps, False), 'Q': (directions, True),
+             'R': (directions[:4], True), 'B': (directions[4:], True)}
+    rays = {}
+    for pieceType, (pieceSteps, slides) in steps.items():
+        rays[pieceType] = []
+        for sq in range(64):
+            squareRays = []
+            for dr, dc in pieceSteps:
+                ray = []
+                r, c = sq // 8 + dr, sq % 8 + dc
+                while 0 <= r <= 7 and 0 <= c <= 7:
+                    ray.append(r * 8 + c)
+                    if not slides:
+                        break
+                    r, c = r + dr, c + dc
+                if ray:
+                    squareRays.append(ray)
+            rays[pieceType].append(squareRays)
+    return rays
+
+RAYS = buildRays()
+
+'''
+Table name for a set of pieces ('wK', 'wQ', 'bK', ...) and whether the colours must be swapped to find it
+'''
+def materialName(pieces):
+    white = ''.join(sorted((piece[1] for piece in pieces if piece[0] == 'w' and piece[1] != 'K'), key=PIECE_ORDER.index))
+    black = ''.join(sorted((piece[1] for piece in pieces if piece[0] == 'b' and piece[1] != 'K'), key=PIECE_ORDER.index))
+    whiteKey = (sum(PIECE_STRENGTH[p] for p in white), len(white), [-PIECE_ORDER.index(p) for p in white])
+    blackKey = (sum(PIECE_STRENGTH[p] for p in black), len(black), [-PIECE_ORDER.index(p) for p in black])
+    if blackKey > whiteKey:
+        return 'K' + black + 'vK' + white, True
+    return 'K' + white + 'vK' + black, False
+
+'''
+The pieces of a table in index order: white king, white pieces, black king, black pieces
+'''
+def tablePieces(name):
+    white, black = name.split('v')
+    return ['w' + p for p in white] + ['b' + p for p in black]
+
+def tableSize(name):
+    return 2 * 64 ** len(tablePieces(name))
+
+'''
+Index of a placement: the squares in table order as base 64 digits, then the side to move as the lowest bit
+'''
+def placementIndex(squares, whiteToMove):
+    index = 0
+    for sq in squares:
+        index = index * 64 + sq
+    return index * 2 + (0 if whiteToMove else 1)
+
+def decodeIndex(index, count):
+    whiteToMove = index & 1 == 0
+    index >>= 1
+    squares = [0] * count
+    for i in range(count - 1, -1, -1):
+        squares[i] = index & 63
+        index >>= 6
+    return squares, whiteToMove
+
+'''
+Smaller tables that captures from this table lead to, largest first
+'''
+def subTables(name):
+    pieces = tablePieces(name)
+    names = []
+    for i in range(len(pieces)):
+        if pieces[i][1] == 'K':
+            continue
+        rest = pieces[:i] + pieces[i + 1:]
+        if len(rest) > 2:
+            subName = materialName(rest)[0]
+            if subName not in names:
+                names.append(subName)
+                names.extend(n for n in subTables(subName) if n not in names)
+    return names
+
+'''
+Value of an entry from the point of view of the side that made the move into it
+'''
+def valueForMover(value):
+    if value == DRAW:
+        return DRAW
+    if value >= LOSS: #the side to move there is mated in n, so the mover mates in n + 1
+        return value - LOSS + 1
+    return LOSS + value + 1
+
+'''
+Order of preference between two values for the side to move: fastest win, then draw, then slowest loss
+'''
+def preference(value):
+    if value == DRAW:
+        return (1, 0)
+    if value < LOSS:
+        return (2, -value)
+    return (0, value)
+
+
+class Tablebases():
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        self.maxPieces = 2
+        for fileName in os.listdir(directory) if os.path.isdir(directory) else []:
+            if fileName.endswith('.tb'):
+                self.maxPieces = max(self.maxPieces, len(tablePieces(fileName[:-3])))
+
+    def path(self, name):
+        return os.path.join(self.directory, name + '.tb')
+
+    '''
+    The mapped table, or None when it has not been generated
+    '''
+    def table(self, name):
+        if name not in self.tables:
+            try:
+                f = open(self.path(name), 'rb')
+            except OSError:
+                self.tables[name] = None
+                return None
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            f.close()
+            magic, version, count = HEADER.unpack_from(data, 0)
+            if magic != MAGIC or version != VERSION or count != tableSize(name):
+                raise ValueError("not a tablebase for " + name + ": " + self.path(name))
+            self.tables[name] = data
+        return self.tables[name]
+
+    def close(self):
+        for data in self.tables.values():
+            if data is not None:
+                data.close()
+        self.tables = {}
+
+    '''
+    Raw entry for pieces given as (piece, square index) with the side to move, or None if there is no table
+    Two kings alone are always a draw
+    '''
+    def lookup(self, placed, whiteToMove):
+        if len(placed) == 2:
+            return DRAW
+        name, swap = materialName([piece for piece, sq in placed])
+        if swap: #mirror top to bottom and swap the colours
+            placed = [(('b' if piece[0] == 'w' else 'w') + piece[1], (7 - sq // 8) * 8 + sq % 8) for piece, sq in placed]
+            whiteToMove = not whiteToMove
+        data = self.table(name)
+        if data is None:
+            return None
+        remaining = list(placed)
+        squares = []
+        for piece in tablePieces(name):
+            for i in range(len(remaining)):
+                if remaining[i][0] == piece:
+                    squares.append(remaining.pop(i)[1])
+                    break
+        return data[HEADER.size + placementIndex(squares, whiteToMove)]
+
+    '''
+    (WIN_RESULT, DRAW_RESULT or LOSS_RESULT for the side to move, plies to mate) for a position with a table,
+    otherwise None. Positions with pawns or castling rights are never in a table
+    '''
+    def probe(self, gs):
+        if len(gs.pieceLocations['w']) + len(gs.pieceLocations['b']) > self.maxPieces or \
+                gs.currentCastlingRight.mask() != 0:
+            return None
+        placed = []
+        for color in ('w', 'b'):
+            for r, c in gs.pieceLocations[color]:
+                piece = gs.board[r][c]
+                if piece[1] == 'p':
+                    return None
+                placed.append((piece, r * 8 + c))
+        value = self.lookup(placed, gs.whiteToMove)
+        if value is None or value == INVALID:
+            return None
+        if value == DRAW:
+            return DRAW_RESULT, 0
+        if value >= LOSS:
+            return LOSS_RESULT, value - LOSS
+        return WIN_RESULT, value
+
+    '''
+    Search score of a probe result from the point of view of the side to move, ply plies from the root
+    '''
+    def score(self, gs, ply):
+        result = self.probe(gs)
+        if result is None:
+            return None
+        outcome, plies = result
+        if outcome == WIN_RESULT:
+            return Search.CHECKMATE - ply - plies
+        if outcome == LOSS_RESULT:
+            return -Search.CHECKMATE + ply + plies
+        return Search.DRAW
+
+'''
+An empty board GameState that placements are written into and cleared from directly
+'''
+def emptyGameState():
+    gs = ChessEngine.GameState('k7/8/8/8/8/8/8/K7 w - - 0 1') #a FEN must have both kings, they are lifted off
+    clearPieces(gs, ('bK', 'wK'), (0, 56))
+    return gs
+
+def placePieces(gs, pieces, squares, whiteToMove):
+    for piece, sq in zip(pieces, squares):
+        r, c = divmod(sq, 8)
+        gs.board[r][c] = piece
+        gs.pieceLocations[piece[0]].add((r, c))
+        if piece == 'wK':
+            gs.wKingLoc = (r, c)
+        elif piece == 'bK':
+            gs.bKingLoc = (r, c)
+    gs.whiteToMove = whiteToMove
+
+def clearPieces(gs, pieces, squares):
+    for piece, sq in zip(pieces, squares):
+        r, c = divmod(sq, 8)
+        gs.board[r][c] = '--'
+        gs.pieceLocations[piece[0]].discard((r, c))
+
+'''
+Scan one chunk of placements with the legal move generator and write (values, quiet move counts, best captures)
+for it to the table's part directory. Runs in the worker processes
+'''
+def scanChunk(task):
+    name, directory, start, end = task
+    pieces = tablePieces(name)
+    count = len(pieces)
+    blackKing = pieces.index('bK')
+    tablebases = Tablebases(directory)
+    gs = emptyGameState()
+    size = end - start
+    values = bytearray([UNKNOWN]) * size
+    quietCounts = bytearray(size)
+    captures = bytearray([NO_CAPTURE]) * size
+    for index in range(start, end):
+        i = index - start
+        squares, whiteToMove = decodeIndex(index, count)
+        if len(set(squares)) < count:
+            values[i] = INVALID
+            continue
+        placePieces(gs, pieces, squares, whiteToMove)
+        waitingKing = squares[blackKing] if whiteToMove else squares[0]
+        if gs.isAttackedBy(waitingKing // 8, waitingKing % 8, 'w' if whiteToMove else 'b'):
+            values[i] = INVALID #the side not to move is in check
+        else:
+            moves = gs.getValidMoves()
+            if len(moves) == 0:
+                values[i] = LOSS if gs.inCheck() else DRAW
+            quiet = 0
+            best = NO_CAPTURE
+            for move in moves:
+                if move.pieceCaptured == '--':
+                    quiet += 1
+                    continue
+                startSq = move.startRow * 8 + move.startCol
+                endSq = move.endRow * 8 + move.endCol
+                placed = [(pieces[j], endSq if squares[j] == startSq else squares[j])
+                          for j in range(count) if squares[j] != endSq]
+                value = tablebases.lookup(placed, not whiteToMove)
+                if value is None:
+                    raise ValueError("missing tablebase for " + materialName([p for p, sq in placed])[0])
+                value = valueForMover(value)
+                if best == NO_CAPTURE or preference(value) > preference(best):
+                    best = value
+            quietCounts[i] = quiet
+            captures[i] = best
+        clearPieces(gs, pieces, squares)
+    tablebases.close()
+    writeAtomically(chunkPath(directory, name, start), bytes(values) + bytes(quietCounts) + bytes(captures))
+    return start
+
+def partDirectory(directory, name):
+    return os.path.join(directory, name + '.part')
+
+def chunkPath(directory, name, start):
+    return os.path.join(partDirectory(directory, name), '%d.bin' % start)
+
+def writeAtomically(path, data):
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+    os.replace(temp, path)
+
+'''
+Placements that can move into the placement index with a quiet move, found by moving the pieces of the side that
+just moved backwards onto empty squares
+'''
+def predecessors(index, pieces):
+    squares, whiteToMove = decodeIndex(index, len(pieces))
+    mover = 'b' if whiteToMove else 'w'
+    occupied = set(squares)
+    base = index & ~1
+    sideBit = 0 if whiteToMove else 1 #the predecessor has the other side to move
+    weight = 2 * 64 ** (len(pieces) - 1)
+    found = []
+    for i in range(len(pieces)):
+        if pieces[i][0] == mover:
+            sq = squares[i]
+            for ray in RAYS[pieces[i][1]][sq]:
+                for target in ray:
+                    if target in occupied:
+                        break
+                    found.append(base + (target - sq) * weight + (1 - sideBit))
+        weight //= 64
+    return found
+
+'''
+Retrograde passes over the scanned table: every position mated at ply n makes its predecessors wins in n + 1,
+and a position whose last quiet move was found to lose becomes a loss. Unresolved positions are draws
+'''
+def retrograde(name, values, quietCounts, captures):
+    pieces = tablePieces(name)
+    levels = {0: []}
+    pendingWins = {}
+    pendingLosses = {}
+    for index in range(len(values)):
+        value = values[index]
+        if value == LOSS:
+            levels[0].append(index)
+        elif value == UNKNOWN:
+            capture = captures[index]
+            if capture != NO_CAPTURE and DRAW < capture < LOSS:
+                pendingWins.setdefault(capture, []).append(index)
+            elif quietCounts[index] == 0 and capture != NO_CAPTURE and capture >= LOSS:
+                pendingLosses.setdefault(capture - LOSS, []).append(index)
+
+    ply = 0
+    while ply < UNKNOWN - 1 and (levels or pendingWins or pendingLosses):
+        level = levels.pop(ply, [])
+        for index in pendingWins.pop(ply, []):
+            if values[index] == UNKNOWN:
+                values[index] = ply
+                level.append(index)
+        for index in pendingLosses.pop(ply, []):
+            if values[index] == UNKNOWN:
+                values[index] = LOSS + ply
+                level.append(index)
+        nextLevel = levels.setdefault(ply + 1, [])
+        for index in level:
+            lost = values[index] >= LOSS
+            for previous in predecessors(index, pieces):
+                if values[previous] != UNKNOWN:
+                    continue
+                if lost:
+                    values[previous] = ply + 1
+                    nextLevel.append(previous)
+                    continue
+                quietCounts[previous] -= 1
+                if quietCounts[previous] == 0:
+                    capture = captures[previous]
+                    if capture == NO_CAPTURE:
+                        loss = ply + 1
+                    elif capture >= LOSS:
+                        loss = max(ply + 1, capture - LOSS)
+                    else: #a capture draws or wins
+                        continue
+                    if loss == ply + 1:
+                        values[previous] = LOSS + loss
+                        nextLevel.append(previous)
+                    else:
+                        pendingLosses.setdefault(loss, []).append(previous)
+        if not nextLevel:
+            del levels[ply + 1]
+        ply += 1
+
+    for index in range(len(values)):
+        if values[index] == UNKNOWN:
+            values[index] = DRAW
+    return values
+
+'''
+Build one table: scan the chunks that are not on disk yet, then run the retrograde passes and write the table
+'''
+def generateTable(name, directory, pool=None, report=print):
+    size = tableSize(name)
+    os.makedirs(partDirectory(directory, name), exist_ok=True)
+    tasks = [(name, directory, start, min(start + CHUNK_SIZE, size)) for start in range(0, size, CHUNK_SIZE)
+             if not os.path.exists(chunkPath(directory, name, start))]
+    start = time.perf_counter()
+    if report is not None and len(tasks) < (size + CHUNK_SIZE - 1) // CHUNK_SIZE:
+        report("%s: resuming, %d of %d chunks left" % (name, len(tasks), (size + CHUNK_SIZE - 1) // CHUNK_SIZE))
+    results = pool.imap_unordered(scanChunk, tasks) if pool is not None else map(scanChunk, tasks)
+    for done, chunkStart in enumerate(results, 1):
+        if report is not None and done % 64 == 0:
+            report("%s: %d of %d chunks scanned" % (name, done, len(tasks)))
+
+    values = bytearray()
+    quietCounts = bytearray()
+    captures = bytearray()
+    for chunkStart in range(0, size, CHUNK_SIZE):
+        with open(chunkPath(directory, name, chunkStart), 'rb') as f:
+            data = f.read()
+        length = len(data) // 3
+        values += data[:length]
+        quietCounts += data[length:2 * length]
+        captures += data[2 * length:]
+    retrograde(name, values, quietCounts, captures)
+    writeAtomically(os.path.join(directory, name + '.tb'), HEADER.pack(MAGIC, VERSION, size) + bytes(values))
+    for chunkStart in range(0, size, CHUNK_SIZE):
+        os.remove(chunkPath(directory, name, chunkStart))
+    os.rmdir(partDirectory(directory, name))
+    if report is not None:
+        longest = max((value for value in values if DRAW < value < LOSS), default=0)
+        report("%s: %d positions in %.1fs, longest win %d plies" % (name, size, time.perf_counter() - start, longest))
+
+'''
+Build the named tables and every smaller table they depend on, skipping those already on disk
+'''
+def generate(names, directory, workers=None, report=print):
+    os.makedirs(directory, exist_ok=True)
+    needed = []
+    for name in names:
+        name = materialName(tablePieces(name))[0]
+        for table in [name] + subTables(name):
+            if table not in needed:
+                needed.append(table)
+    needed.sort(key=lambda table: len(tablePieces(table)))
+    workers = workers or os.cpu_count()
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        for name in needed:
+            if os.path.exists(os.path.join(directory, name + '.tb')):
+                continue
+            generateTable(name, directory, pool, report)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="generate or probe endgame tablebases")
+    parser.add_argument("directory")
+    parser.add_argument("--tables", nargs="*", default=list(DEFAULT_TABLES), help="material to build, e.g. KQvKR")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--probe", metavar="FEN", help="look up a position instead of generating")
+    args = parser.parse_args()
+
+    if args.probe is None:
+        generate(args.tables, args.directory, args.workers)
+        return
+    tablebases = Tablebases(args.directory)
+    result = tablebases.probe(ChessEngine.GameState(args.probe))
+    if result is None:
+        print("not in the tablebases")
+    else:
+        outcome, plies = result
+        print({WIN_RESULT: "win", DRAW_RESULT: "draw", LOSS_RESULT: "loss"}[outcome] +
+              (" in %d plies" % plies if outcome != DRAW_RESULT else ""))
+    tablebases.close()
+
+
+if __name__ == '__main__':
+    main()
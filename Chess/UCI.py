@@ -0,0 +1,183 @@
+"""
+UCI front end so the engine can be driven by chess GUIs, match runners and tournament harnesses without a display.
+Supports uci, isready, ucinewgame, position startpos/fen [moves ...], go depth/movetime/nodes/wtime/btime/infinite,
+stop and quit. Searches run on an EngineWorker so stop and isready are answered while the engine thinks.
+Run from the project root with: python -m Chess.UCI [--backend bitboard] [--book book.bin] [--tablebases DIR]
+"""
+import argparse
+import sys
+import threading
+
+from Chess import ChessEngine, EngineWorker, OpeningBook, Search, Tablebase
+
+ENGINE_NAME = "ChessProject"
+ENGINE_AUTHOR = "bsauberman"
+MOVES_TO_GO = 30 #assumed moves left in the game when the GUI only sends a clock
+
+
+class UCIEngine():
+    def __init__(self, output=sys.stdout, backend='mailbox', book=None, tablebases=None):
+        self.output = output
+        self.book = book #OpeningBook played from before searching, or None
+        self.outputLock = threading.Lock() #info lines come from the worker thread
+        self.backend = backend
+        self.gs = ChessEngine.newGameState(backend)
+        self.worker = EngineWorker.EngineWorker(tablebases=tablebases)
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    '''
+    Handle one command line; returns False when the engine should exit
+    '''
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.worker.cancel()
+            self.worker.searcher.table.clear()
+            self.gs = ChessEngine.newGameState(self.backend)
+        elif command == "position":
+            self.worker.cancel()
+            try:
+                self.gs = self.parsePosition(args)
+            except ValueError as error:
+                self.send("info string " + str(error))
+        elif command == "go":
+            self.go(args)
+        elif command == "stop":
+            self.worker.stop()
+        elif command == "quit":
+            self.worker.shutdown()
+            return False
+        return True
+
+    '''
+    position startpos [moves ...] or position fen <6 fields> [moves ...]
+    '''
+    def parsePosition(self, args):
+        if "moves" in args:
+            split = args.index("moves")
+            args, moves = args[:split], args[split + 1:]
+        else:
+            moves = []
+        if args and args[0] == "startpos":
+            gs = ChessEngine.newGameState(self.backend)
+        elif args and args[0] == "fen":
+            gs = ChessEngine.newGameState(self.backend, " ".join(args[1:]))
+        else:
+            raise ValueError("position needs startpos or fen")
+        for text in moves:
+            gs.makeMove(parseMove(gs, text))
+        return gs
+
+    '''
+    Start a search with the limits given; bestmove is sent when it finishes or is stopped
+    '''
+    def go(self, args):
+        if self.book is not None and "infinite" not in args:
+            move = self.book.pickMove(self.gs)
+            if move is not None:
+                self.send("info string book move")
+                self.send("bestmove " + moveToUci(move))
+                return
+        options = {}
+        i = 0
+        while i < len(args):
+            if args[i] == "infinite":
+                options["infinite"] = True
+                i += 1
+            elif i + 1 < len(args):
+                try:
+                    options[args[i]] = int(args[i + 1])
+                except ValueError:
+                    pass
+                i += 2
+            else:
+                i += 1
+
+        maxDepth = options.get("depth", 64)
+        nodeLimit = options.get("nodes")
+        timeLimit = None
+        if "movetime" in options:
+            timeLimit = options["movetime"] / 1000
+        elif not options.get("infinite"):
+            clock = options.get("wtime" if self.gs.whiteToMove else "btime")
+            if clock is not None:
+                increment = options.get("winc" if self.gs.whiteToMove else "binc", 0)
+                timeLimit = (clock / options.get("movestogo", MOVES_TO_GO) + increment * 3 / 4) / 1000
+                timeLimit = min(timeLimit, clock / 1000 / 2) #never spend half the clock on one move
+
+        future = self.worker.submitSearch(self.gs, maxDepth, timeLimit, nodeLimit, self.sendInfo)
+        future.add_done_callback(self.sendBestMove)
+
+    def sendInfo(self, result):
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s" % (
+            result.depth, formatScore(result.score), result.nodes, result.nps, int(result.elapsed * 1000),
+            " ".join(moveToUci(move) for move in result.pv)))
+
+    def sendBestMove(self, future):
+        if future.cancelled():
+            return
+        try:
+            result = future.result()
+        except Exception as error: #the GUI waits for a bestmove whatever happened to the search
+            self.send("info string search failed: %s" % error)
+            self.send("bestmove 0000")
+            return
+        if result is None: #cancelled before it started
+            return
+        self.send("bestmove " + (moveToUci(result.bestMove) if result.bestMove is not None else "0000"))
+
+'''
+Long algebraic notation as UCI uses it, e.g. e2e4 or e7e8q
+'''
+def moveToUci(move):
+    notation = move.getChessNotation()
+    if move.isPawnPromotion:
+        notation += move.promotionChoice.lower()
+    return notation
+
+def parseMove(gs, text):
+    for move in gs.getValidMoves():
+        if moveToUci(move) == text:
+            return move
+    raise ValueError("illegal move " + text)
+
+def formatScore(score):
+    if score >= Search.MATE_BOUND:
+        return "mate %d" % ((Search.CHECKMATE - score + 1) // 2)
+    if score <= -Search.MATE_BOUND:
+        return "mate %d" % -((Search.CHECKMATE + score) // 2)
+    return "cp %d" % score
+
+def main():
+    parser = argparse.ArgumentParser(description="UCI engine over stdin and stdout")
+    parser.add_argument("--backend", default="mailbox", help="GameState backend: mailbox or bitboard")
+    parser.add_argument("--book", help="opening book file built by Chess.OpeningBook")
+    parser.add_argument("--tablebases", metavar="DIR", help="directory of tables built by Chess.Tablebase")
+    args = parser.parse_args()
+    book = OpeningBook.OpeningBook(args.book) if args.book else None
+    tablebases = Tablebase.Tablebases(args.tablebases) if args.tablebases else None
+    engine = UCIEngine(backend=args.backend, book=book, tablebases=tablebases)
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    else:
+        engine.worker.shutdown()
+    if book is not None:
+        book.close()
+
+
+if __name__ == '__main__':
+    main()